@@ -0,0 +1,131 @@
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+from recipes.versions import bump_version, get_version, model_version_name
+from .metrics import count_cache
+
+
+class ReferenceSnapshot:
+    '''
+    Loaded state of reference table: model instances mapped by id,
+    their representation and representation rendered to JSON.
+    '''
+    def __init__(self, version, objects, fields):
+        self.version = version
+        self.objects = {obj.pk: obj for obj in objects}
+        self.data = [
+            {field: getattr(obj, field) for field in fields}
+            for obj in objects
+        ]
+        self.content = JSONRenderer().render(self.data)
+
+
+class ReferenceData:
+    '''
+    Process-local read-through cache of small, rarely changed table.
+    Snapshot is reloaded when version stamp shared through Django cache
+    changes, so a write in one worker invalidates snapshots in all workers.
+    '''
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.name = model_version_name(model)
+        self._snapshot = None
+        self._lock = Lock()
+
+    def __deepcopy__(self, memo):
+        # Serializer fields are deep copied per serializer instance,
+        # reference data has to stay shared.
+        return self
+
+    def get_snapshot(self):
+        version = get_version(self.name)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            count_cache(f'reference:{self.name}', misses=1)
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = ReferenceSnapshot(
+                        version,
+                        list(self.model.objects.order_by('pk')),
+                        self.fields
+                    )
+                    self._snapshot = snapshot
+        else:
+            count_cache(f'reference:{self.name}', hits=1)
+        return snapshot
+
+    def get_many(self, ids):
+        '''Returns cached objects of given ids mapped by id.'''
+        objects = self.get_snapshot().objects
+        return {pk: objects[pk] for pk in ids if pk in objects}
+
+    def invalidate(self):
+        bump_version(self.name)
+        self._snapshot = None
+
+
+tags_reference = ReferenceData(Tag, ('id', 'name', 'color', 'slug'))
+ingredients_reference = ReferenceData(
+    Ingredient, ('id', 'name', 'measurement_unit')
+)
+
+
+class RepresentationCache:
+    '''
+    Shared cache of object representations which do not depend on viewer.
+    Keys include version stamps of reference data used in representation,
+    so a change of a tag or an ingredient invalidates every entry at once.
+    Missing representations are rendered for all objects in one query.
+    '''
+    def __init__(self, name, serializer_class, queryset, references=()):
+        self.name = name
+        self.serializer_class = serializer_class
+        self.queryset = queryset
+        self.references = references
+
+    def get_keys(self, pks):
+        suffix = ':'.join(
+            get_version(reference.name) for reference in self.references
+        )
+        return {pk: f'{self.name}:{pk}:{suffix}' for pk in pks}
+
+    def get_many(self, pks):
+        '''Returns representations of objects with given ids by id.'''
+        keys = self.get_keys(pks)
+        cached = cache.get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in cached]
+        count_cache(
+            f'representation:{self.name}',
+            hits=len(keys) - len(missing), misses=len(missing)
+        )
+        if missing:
+            rendered = {
+                keys[obj.pk]: self.serializer_class(obj).data
+                for obj in self.queryset.filter(pk__in=missing)
+            }
+            cache.set_many(
+                rendered, timeout=settings.REPRESENTATION_CACHE_TIMEOUT
+            )
+            cached.update(rendered)
+        return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    def attach(self, objects):
+        '''
+        Sets cached_representation attribute of every object.
+        Object deleted after it was read is serialized as it is.
+        '''
+        representations = self.get_many({obj.pk for obj in objects})
+        for obj in objects:
+            representation = representations.get(obj.pk)
+            if representation is None:
+                representation = self.serializer_class(obj).data
+            obj.cached_representation = representation
+
+    def invalidate(self, pks):
+        cache.delete_many(self.get_keys(pks).values())
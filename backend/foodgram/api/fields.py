@@ -1,19 +1,172 @@
 import base64
+import binascii
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from PIL import Image
 from rest_framework import serializers
 
+BASE64_MARKER = ';base64,'
+
+
+def image_pixels(file):
+    '''
+    Returns pixel count read from image header without decoding image data
+    or None if header can not be parsed yet.
+    '''
+    position = file.tell()
+    try:
+        width, height = Image.open(file).size
+    except Image.DecompressionBombError:
+        return float('inf')
+    except Exception:
+        return None
+    finally:
+        file.seek(position)
+    return width * height
+
 
 class Base64ImageField(serializers.ImageField):
     '''
     Customises 'to_internal_value' function
     to decode base64 image string into file.
+
+    String is decoded chunk by chunk into uploaded file which is kept
+    in memory or spooled to temporary file like regular uploads.
+    Decoded size is checked before decoding and pixel count is checked
+    from image header as soon as it is decoded.
     '''
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'too_many_pixels': (
+            'Изображение содержит больше {max_pixels} пикселей.'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
 
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        marker_position = data.find(BASE64_MARKER)
+        start = marker_position + len(BASE64_MARKER)
+        encoded_size = len(data) - start
+        if marker_position == -1 or encoded_size % 4:
+            self.fail('invalid_base64')
+        size = encoded_size // 4 * 3 - data.count('=', len(data) - 2)
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        ext = data[:marker_position].split('/')[-1]
+        name, content_type = 'temp.' + ext, 'image/' + ext
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None
+            )
+        chunk_size = settings.IMAGE_UPLOAD_CHUNK_SIZE
+        pixels = None
+        try:
+            for position in range(start, len(data), chunk_size):
+                chunk = base64.b64decode(
+                    data[position:position + chunk_size], validate=True
+                )
+                if position == start:
+                    pixels = image_pixels(BytesIO(chunk))
+                    self.check_pixels(pixels)
+                file.write(chunk)
+            file.seek(0)
+            if pixels is None:
+                self.check_pixels(image_pixels(file))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        return file
+
+    def check_pixels(self, pixels):
+        if pixels is not None and pixels > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS
+            )
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    '''
+    Represents urls of recipe image variants keyed by variant name.
+    '''
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = recipe.image_urls()
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+
+
+class CachedRepresentationField(serializers.ReadOnlyField):
+    '''
+    Reads part of representation stored in cached_representation
+    attribute of serialized object.
+    '''
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return instance.cached_representation[self.field_name]
+
+
+class PrimaryKeyListField(serializers.ListField):
+    '''
+    List field which resolves primary keys of all items at once.
+    Keys are looked up in reference data cache, the rest are fetched
+    with a single id__in query and all missing keys are reported together.
+    Items are either primary keys or dictionaries with primary key
+    stored under id_key.
+    '''
+    default_error_messages = {
+        'does_not_exist': 'Не найдены объекты с номерами: {pk_values}.'
+    }
+
+    def __init__(self, reference, id_key=None, **kwargs):
+        self.reference = reference
+        self.id_key = id_key
+        super().__init__(**kwargs)
+
+    def get_pk(self, item):
+        return item if self.id_key is None else item[self.id_key]
+
+    def resolve(self, item, objects):
+        if self.id_key is None:
+            return objects[item]
+        return {**item, self.id_key: objects[item[self.id_key]]}
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        pks = {self.get_pk(item) for item in items}
+        objects = self.reference.get_many(pks)
+        missing_pks = pks - objects.keys()
+        if missing_pks:
+            objects.update(self.reference.model.objects.in_bulk(missing_pks))
+            missing_pks -= objects.keys()
+        if missing_pks:
+            self.fail(
+                'does_not_exist',
+                pk_values=', '.join(map(str, sorted(missing_pks)))
+            )
+        return [self.resolve(item, objects) for item in items]
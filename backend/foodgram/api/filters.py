@@ -1,24 +1,32 @@
+from django.db.models import Count
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, RecipeTag
 from users.models import User
+from .cache import tags_reference
 
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODES = ((TAGS_MODE_ANY, TAGS_MODE_ANY), (TAGS_MODE_ALL, TAGS_MODE_ALL))
 
-class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+def tag_choices():
+    return [
+        (tag.slug, tag.name)
+        for tag in tags_reference.get_snapshot().objects.values()
+    ]
 
 
 class RecipeFilter(filters.FilterSet):
 
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tag_list__tag__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_by_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method='skip_filter'
     )
     is_favorited = filters.BooleanFilter(
         field_name='fans__user',
@@ -33,6 +41,32 @@ class RecipeFilter(filters.FilterSet):
         model = Recipe
         fields = ('author', 'tags')
 
+    def filter_by_tags(self, queryset, field_name, value):
+        '''
+        Keeps recipes having any (default) or all of the tags. Slugs are
+        resolved to ids from tags reference cache and recipes are matched
+        by a single subquery on RecipeTag, so no join multiplies rows
+        and no DISTINCT is needed.
+        '''
+        if not value:
+            return queryset
+        slugs = set(value)
+        tag_ids = [
+            tag.pk for tag in tags_reference.get_snapshot().objects.values()
+            if tag.slug in slugs
+        ]
+        recipe_tags = RecipeTag.objects.filter(tag_id__in=tag_ids)
+        mode = self.form.cleaned_data.get('tags_mode')
+        if mode == TAGS_MODE_ALL and len(tag_ids) > 1:
+            recipe_tags = recipe_tags.values('recipe_id').annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(tag_ids))
+        return queryset.filter(pk__in=recipe_tags.values('recipe_id'))
+
+    def skip_filter(self, queryset, field_name, value):
+        '''Mode of other filter, it does not filter by itself.'''
+        return queryset
+
     def filter_by_favorites(self, queryset, field_name, value):
         current_user = self.request.user
         if current_user.is_authenticated and value:
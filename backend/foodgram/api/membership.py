@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import FavoriteRecipe, ShoplistRecipe
+from recipes.versions import (bump_version, get_version,
+                              membership_version_name)
+from users.models import Follow
+from .metrics import count_cache
+
+
+class Membership:
+    '''
+    Per-user cached set of ids of objects linked to user
+    through membership model.
+
+    Rows are written through MembershipManager, whose result decides
+    whether the request was valid. Save and delete receivers bump
+    user membership version stamp once the write commits. Sets are
+    cached under the stamp, which is part of ETag as well, so a set
+    loaded before the bump and stored after it is never served
+    under the new ETag. Set is reloaded with one query on next read.
+    '''
+    def __init__(self, model, user_field, target_field):
+        self.model = model
+        self.user_field = user_field
+        self.target_field = target_field
+        self.name = model._meta.label_lower
+
+    def get_key(self, user_id):
+        version = get_version(membership_version_name(user_id))
+        return f'membership:{self.name}:{user_id}:{version}'
+
+    def get(self, user_id):
+        '''Returns ids of objects linked to user.'''
+        key = self.get_key(user_id)
+        ids = cache.get(key)
+        count_cache(f'membership:{self.name}', hits=ids is not None,
+                    misses=ids is None)
+        if ids is None:
+            ids = frozenset(self.model.objects.filter(
+                **{self.user_field: user_id}
+            ).values_list(self.target_field, flat=True))
+            cache.set(
+                key, ids, timeout=settings.MEMBERSHIP_CACHE_TIMEOUT
+            )
+        return ids
+
+    def add(self, user, target):
+        '''Links target to user, returns False if already linked.'''
+        return self.model.objects.add(
+            **{self.user_field: user, self.target_field: target}
+        )
+
+    def remove(self, user, target):
+        '''Unlinks target from user, returns False if it was not linked.'''
+        return self.model.objects.remove(
+            **{self.user_field: user, self.target_field: target}
+        )
+
+    def invalidate(self, user_id):
+        '''Retires cached sets of the user once transaction commits.'''
+        transaction.on_commit(
+            lambda: bump_version(membership_version_name(user_id))
+        )
+
+
+favorites = Membership(FavoriteRecipe, 'user', 'recipe')
+shoplist = Membership(ShoplistRecipe, 'user', 'recipe')
+follows = Membership(Follow, 'follower', 'author')
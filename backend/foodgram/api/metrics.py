@@ -0,0 +1,110 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.db import connections
+from prometheus_client import Counter, Histogram
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'API request duration by view and action.',
+    ['view', 'action', 'method', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_queries',
+    'Number of database queries per API request by view and action.',
+    ['view', 'action'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf'))
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests',
+    'Cache lookups by cache and result.',
+    ['cache', 'result']
+)
+RECIPE_RELATIONS_TOUCHED = Histogram(
+    'foodgram_recipe_relations_touched',
+    'Ingredient and tag rows written by a recipe update.',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, float('inf'))
+)
+PDF_RENDER_DURATION = Histogram(
+    'foodgram_shoplist_pdf_render_seconds',
+    'Time spent rendering shoplist pdf documents.'
+)
+PDF_SIZE = Histogram(
+    'foodgram_shoplist_pdf_size_bytes',
+    'Size of rendered shoplist pdf documents.',
+    buckets=tuple(2 ** power for power in range(12, 25, 2)) + (float('inf'),)
+)
+
+
+def count_cache(cache, hits=0, misses=0, stale=0):
+    '''Counts results of lookups in named cache.'''
+    for result, amount in (('hit', hits), ('miss', misses), ('stale', stale)):
+        if amount:
+            CACHE_REQUESTS.labels(cache, result).inc(amount)
+
+
+def observe_pdf(chunks):
+    '''
+    Passes rendered pdf chunks through and records time spent
+    producing them and size of the complete document.
+    Time the client takes to receive the chunks is not counted.
+    '''
+    chunks = iter(chunks)
+    render_time = 0
+    size = 0
+    while True:
+        started = perf_counter()
+        chunk = next(chunks, None)
+        render_time += perf_counter() - started
+        if chunk is None:
+            break
+        size += len(chunk)
+        yield chunk
+    PDF_RENDER_DURATION.observe(render_time)
+    PDF_SIZE.observe(size)
+
+
+class QueryCounter:
+    '''Database execute wrapper counting queries.'''
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    '''
+    Records duration and query count of requests handled by DRF views,
+    labelled with view class name and viewset action.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        queries = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        labels = getattr(request, 'metrics_labels', None)
+        if labels is not None:
+            view, action = labels
+            REQUEST_DURATION.labels(
+                view, action, request.method, response.status_code
+            ).observe(perf_counter() - started)
+            REQUEST_QUERIES.labels(view, action).observe(queries.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            return None
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        request.metrics_labels = (
+            view_class.__name__, actions.get(method, method)
+        )
+        return None
@@ -1,6 +1,17 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
+from recipes.versions import get_versions, membership_version_name
+from .metrics import count_cache
 from .permissions import IsAdminOrOwner
 
 
@@ -12,3 +23,192 @@ class IsAdminOrOwnerMixin(viewsets.GenericViewSet):
         else:
             permission_classes = [AllowAny, ]
         return [permission() for permission in permission_classes]
+
+
+class CursorPaginationMixin:
+    '''
+    Switches cursor_pagination_actions of view to cursor_pagination_class
+    when request contains pagination=cursor query parameter.
+    '''
+    cursor_pagination_class = None
+    cursor_pagination_actions = ('list',)
+    pagination_mode_query_param = 'pagination'
+
+    @property
+    def paginator(self):
+        use_cursor = (
+            not hasattr(self, '_paginator')
+            and self.cursor_pagination_class is not None
+            and self.action in self.cursor_pagination_actions
+            and self.request.query_params.get(
+                self.pagination_mode_query_param
+            ) == 'cursor'
+        )
+        if use_cursor:
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class NotModified(Exception):
+    '''Interrupts request handling with 304 response.'''
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    '''
+    Answers conditional list and retrieve requests with 304
+    before handler is called. ETag and Last-Modified are derived
+    from version stamps of data sets named in version_names
+    and, for authorised user, of user favorites, shoplist and follows.
+    '''
+    version_names = ()
+    conditional_actions = ('list', 'retrieve')
+
+    def get_version_names(self):
+        names = list(self.version_names)
+        if self.request.user.is_authenticated:
+            names.append(membership_version_name(self.request.user.pk))
+        return names
+
+    def get_validators(self):
+        versions = get_versions(self.get_version_names())
+        digest = hashlib.sha1(':'.join((
+            str(self.request.user.pk), self.request.accepted_renderer.format,
+            *versions
+        )).encode()).hexdigest()
+        return f'"{digest}"', int(max(map(float, versions)))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if self.action in self.conditional_actions:
+            self.validators = self.get_validators()
+            etag, last_modified = self.validators
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        validators = getattr(self, 'validators', None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.API_CACHE_MAX_AGE
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AnonymousResponseCacheMixin:
+    '''
+    Caches list and retrieve payloads for anonymous users in shared cache.
+
+    Key is built from action, object id, host, renderer and sorted
+    query parameters. Entry is stored with version stamps
+    of version_names and is stale once any of them changes
+    or RESPONSE_CACHE_TIMEOUT passes. Stale entry is kept
+    for RESPONSE_CACHE_STALE_TIMEOUT more seconds. Only the worker
+    which takes the lock recomputes the entry, others serve
+    the stale payload meanwhile or, if there is none,
+    wait up to RESPONSE_CACHE_WAIT_TIMEOUT seconds for the new one.
+    '''
+    version_names = ()
+    anonymous_cache_actions = ('list', 'retrieve')
+    anonymous_cache_poll_interval = 0.05
+
+    def get_anonymous_cache_key(self, request):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+        )
+        digest = hashlib.sha1(repr((
+            self.action, self.kwargs.get(self.lookup_field),
+            request.get_host(), request.accepted_renderer.format, params
+        )).encode()).hexdigest()
+        return f'response:{self.basename}:{digest}'
+
+    def wait_for_cached_payload(self, key):
+        '''
+        Polls cache until worker holding the lock stores the entry,
+        returns None if it does not appear in time.
+        '''
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(self.anonymous_cache_poll_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[2]
+        return None
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if (
+            request.user.is_authenticated
+            or self.action not in self.anonymous_cache_actions
+        ):
+            return handler(request, *args, **kwargs)
+        key = self.get_anonymous_cache_key(request)
+        cache_name = f'response:{self.basename}'
+        generation = get_versions(self.version_names)
+        entry = cache.get(key)
+        if (
+            entry is not None and entry[0] == generation
+            and entry[1] > time.time()
+        ):
+            count_cache(cache_name, hits=1)
+            return Response(entry[2])
+        lock_key = f'{key}:lock'
+        if not cache.add(
+            lock_key, True, timeout=settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        ):
+            if entry is not None:
+                count_cache(cache_name, stale=1)
+                return Response(entry[2])
+            payload = self.wait_for_cached_payload(key)
+            if payload is not None:
+                count_cache(cache_name, hits=1)
+                return Response(payload)
+            count_cache(cache_name, misses=1)
+            return handler(request, *args, **kwargs)
+        count_cache(cache_name, misses=1)
+        try:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                fresh_until = time.time() + settings.RESPONSE_CACHE_TIMEOUT
+                cache.set(
+                    key, (generation, fresh_until, response.data),
+                    timeout=(
+                        settings.RESPONSE_CACHE_TIMEOUT
+                        + settings.RESPONSE_CACHE_STALE_TIMEOUT
+                    )
+                )
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,5 +1,59 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from .utils import explain_json
 
 
 class PageNumberLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def approximate_count(queryset):
+    '''
+    Returns query planner estimate of queryset rows number on PostgreSQL,
+    other databases fall back to exact count.
+    '''
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = explain_json(queryset.order_by().values('pk'))
+    return plan[0]['Plan']['Plan Rows']
+
+
+class CursorLimitPagination(CursorPagination):
+    '''
+    Keyset pagination, which filters by position of the last shown object
+    instead of OFFSET, so that deep pages cost the same as the first one.
+    Total count is omitted unless requested with
+    count=exact or count=approximate query parameter.
+    '''
+    page_size = 6
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = request.query_params.get(self.count_query_param)
+        self.count = None
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'approximate':
+            self.count = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response_data = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response_data = {'count': self.count, **response_data}
+        return Response(response_data)
+
+
+class RecipeCursorPagination(CursorLimitPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(CursorLimitPagination):
+    ordering = ('-id',)
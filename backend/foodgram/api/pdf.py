@@ -0,0 +1,239 @@
+import os
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase import pdfmetrics, ttfonts
+
+FONT_NAME = 'FreeSans'
+FONT_FILE = 'FreeSans.ttf'
+
+
+@lru_cache(maxsize=None)
+def register_font(font_name=FONT_NAME, font_file=FONT_FILE):
+    '''
+    Registers TrueType font in reportlab registry once per process
+    and returns registered font object.
+    '''
+    font_path = os.path.join(
+        settings.BASE_DIR, 'reportlabs', 'fonts', font_file
+    )
+    pdfmetrics.registerFont(ttfonts.TTFont(font_name, font_path))
+    return pdfmetrics.getFont(font_name)
+
+
+def buffered(chunks, buffer_size):
+    '''
+    Joins small document chunks into blocks of at least buffer_size bytes
+    so that response is sent with a bounded number of writes.
+    '''
+    buffer = []
+    buffered_size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered_size += len(chunk)
+        if buffered_size >= buffer_size:
+            yield b''.join(buffer)
+            buffer, buffered_size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _pdf_text(text):
+    '''Encodes text as PDF hex string in UTF-16 with byte order mark.'''
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode() + b'>'
+
+
+class StreamingPDF:
+    '''
+    Minimal text-only PDF writer that emits every page as soon as
+    it is finished.
+
+    Page tree, shared resources and font subsets are referenced
+    through object numbers reserved upfront and written after the last
+    page together with cross-reference table, so the writer keeps
+    only the current page content in memory.
+    '''
+    def __init__(self, font, title='', pagesize=A4):
+        self.font = font
+        self.title = title
+        self.width, self.height = pagesize
+        self.position = 0
+        self.objects_count = 0
+        self.offsets = {}
+        self.page_numbers = []
+        self.operations = []
+        self.catalog_number = self._reserve()
+        self.pages_number = self._reserve()
+        self.resources_number = self._reserve()
+
+    def _reserve(self):
+        self.objects_count += 1
+        return self.objects_count
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self.position += len(chunk)
+        return chunk
+
+    def _stream(self, number, content, **entries):
+        data = zlib.compress(content)
+        entries = b''.join(
+            b' /%s %s' % (key.encode(), value)
+            for key, value in entries.items()
+        )
+        return self._object(
+            number,
+            b'<< /Length %d /Filter /FlateDecode%s >>\nstream\n%s\nendstream'
+            % (len(data), entries, data)
+        )
+
+    def begin(self):
+        '''Returns document header.'''
+        header = b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n'
+        self.position += len(header)
+        return header
+
+    def draw_string(self, x, y, size, text):
+        '''Adds a line of text to the current page.'''
+        operations = [b'BT 1 0 0 1 %s %s Tm' % (
+            fp_str(x).encode(), fp_str(y).encode()
+        )]
+        for subset, chunk in self.font.splitString(text, self):
+            operations.append(b'/F%d %s Tf <%s> Tj' % (
+                subset, fp_str(size).encode(), chunk.hex().encode()
+            ))
+        operations.append(b'ET')
+        self.operations.append(b' '.join(operations))
+
+    def show_page(self):
+        '''Finishes current page and returns its objects.'''
+        content_number = self._reserve()
+        page_number = self._reserve()
+        self.page_numbers.append(page_number)
+        chunk = self._stream(content_number, b'\n'.join(self.operations))
+        self.operations = []
+        return chunk + self._object(page_number, (
+            b'<< /Type /Page /Parent %d 0 R /Resources %d 0 R '
+            b'/MediaBox [0 0 %s %s] /Contents %d 0 R >>' % (
+                self.pages_number, self.resources_number,
+                fp_str(self.width).encode(), fp_str(self.height).encode(),
+                content_number
+            )
+        ))
+
+    def _font_objects(self):
+        '''
+        Returns objects of every font subset used in document
+        and resource entries referencing them.
+        '''
+        chunks = []
+        font_entries = []
+        face = self.font.face
+        state = self.font.state.get(self)
+        if state is None:
+            return chunks, font_entries
+        state.frozen = 1
+        for subset_index, subset in enumerate(state.subsets):
+            font_name = b''.join((
+                ttfonts.SUBSETN(subset_index), b'+',
+                face.name, face.subfontNameX
+            ))
+            font_file = face.makeSubset(subset)
+            file_number = self._reserve()
+            chunks.append(self._stream(
+                file_number, font_file, Length1=b'%d' % len(font_file)
+            ))
+            descriptor_number = self._reserve()
+            flags = (
+                face.flags & ~ttfonts.FF_NONSYMBOLIC | ttfonts.FF_SYMBOLIC
+            )
+            chunks.append(self._object(descriptor_number, (
+                b'<< /Type /FontDescriptor /FontName /%s /Flags %d '
+                b'/FontBBox [%s] /ItalicAngle %s /Ascent %s /Descent %s '
+                b'/CapHeight %s /StemV %s /MissingWidth %s '
+                b'/FontFile2 %d 0 R >>' % (
+                    font_name, flags,
+                    b' '.join(fp_str(value).encode() for value in face.bbox),
+                    fp_str(face.italicAngle).encode(),
+                    fp_str(face.ascent).encode(),
+                    fp_str(face.descent).encode(),
+                    fp_str(face.capHeight).encode(),
+                    fp_str(face.stemV).encode(),
+                    fp_str(face.defaultWidth).encode(),
+                    file_number
+                )
+            )))
+            cmap_number = self._reserve()
+            cmap = ttfonts.makeToUnicodeCMap(
+                font_name.decode('latin-1'), subset
+            )
+            chunks.append(self._stream(cmap_number, cmap.encode('latin-1')))
+            font_number = self._reserve()
+            widths = b' '.join(
+                fp_str(face.getCharWidth(code)).encode() for code in subset
+            )
+            chunks.append(self._object(font_number, (
+                b'<< /Type /Font /Subtype /TrueType /BaseFont /%s '
+                b'/FirstChar 0 /LastChar %d /Widths [%s] '
+                b'/ToUnicode %d 0 R /FontDescriptor %d 0 R >>' % (
+                    font_name, len(subset) - 1, widths,
+                    cmap_number, descriptor_number
+                )
+            )))
+            font_entries.append(
+                b'/F%d %d 0 R' % (subset_index, font_number)
+            )
+        return chunks, font_entries
+
+    def end(self):
+        '''
+        Returns font subsets, page tree, catalog
+        and cross-reference table which finish the document.
+        '''
+        chunks, font_entries = self._font_objects()
+        self.close()
+        chunks.append(self._object(
+            self.resources_number,
+            b'<< /Font << %s >> /ProcSet [/PDF /Text] >>'
+            % b' '.join(font_entries)
+        ))
+        chunks.append(self._object(
+            self.pages_number,
+            b'<< /Type /Pages /Count %d /Kids [%s] >>' % (
+                len(self.page_numbers),
+                b' '.join(b'%d 0 R' % number for number in self.page_numbers)
+            )
+        ))
+        chunks.append(self._object(
+            self.catalog_number,
+            b'<< /Type /Catalog /Pages %d 0 R >>' % self.pages_number
+        ))
+        info_number = self._reserve()
+        chunks.append(self._object(
+            info_number,
+            b'<< /Title %s /Producer (foodgram) >>' % _pdf_text(self.title)
+        ))
+        xref_position = self.position
+        chunks.append(b'xref\n0 %d\n0000000000 65535 f \n' % (
+            len(self.offsets) + 1
+        ))
+        chunks.extend(
+            b'%010d 00000 n \n' % self.offsets[number]
+            for number in sorted(self.offsets)
+        )
+        chunks.append(
+            b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n' % (
+                len(self.offsets) + 1, self.catalog_number,
+                info_number, xref_position
+            )
+        )
+        return b''.join(chunks)
+
+    def close(self):
+        '''Releases font subset state kept by reportlab for the document.'''
+        self.font.state.pop(self, None)
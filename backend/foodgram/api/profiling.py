@@ -0,0 +1,184 @@
+import json
+import logging
+import random
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)'), '(...)'),
+)
+
+
+def fingerprint(sql):
+    '''
+    Returns sql with literals and parameters replaced by placeholders
+    and parameter lists collapsed, so repeated queries of N+1 pattern
+    share the same fingerprint.
+    '''
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class RequestProfile:
+    '''Query, timing and size statistics of a single sampled request.'''
+    def __init__(self):
+        self.started = perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.timings = defaultdict(float)
+        self.active_timers = set()
+
+    def execute(self, execute, sql, params, many, context):
+        '''Database execute wrapper counting and timing queries.'''
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        '''Returns most repeated query fingerprints with their counts.'''
+        return [
+            (sql, count) for sql, count in self.fingerprints.most_common(
+                settings.PROFILING_TOP_DUPLICATES
+            ) if count > 1
+        ]
+
+    def server_timing(self):
+        repeated = sum(
+            count - 1 for count in self.fingerprints.values() if count > 1
+        )
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.queries} queries, {repeated} repeated"',
+            *(
+                f'{name};dur={duration * 1000:.1f}'
+                for name, duration in self.timings.items()
+            ),
+            f'total;dur={self.duration * 1000:.1f}',
+        ]
+        return ', '.join(metrics)
+
+    def log(self, request, response, size, stream_time=None):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(self.duration * 1000, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'duplicates': [
+                {'sql': sql[:300], 'count': count}
+                for sql, count in self.duplicates()
+            ],
+            **{
+                f'{name}_ms': round(duration * 1000, 1)
+                for name, duration in self.timings.items()
+            },
+            'response_bytes': size,
+        }
+        if stream_time is not None:
+            record['stream_ms'] = round(stream_time * 1000, 1)
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def get_profile():
+    '''Returns profile of the current request if it is sampled.'''
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def timer(name):
+    '''
+    Adds duration of the block to named timing of sampled request.
+    Nested blocks of the same name are counted once.
+    '''
+    profile = get_profile()
+    if profile is None or name in profile.active_timers:
+        yield
+        return
+    profile.active_timers.add(name)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] += perf_counter() - started
+        profile.active_timers.discard(name)
+
+
+def install_serializer_timer():
+    '''Makes serializer data property report time as serialize timing.'''
+    data = BaseSerializer.data.fget
+    if getattr(data, 'profiled', False):
+        return
+
+    def profiled_data(serializer):
+        with timer('serialize'):
+            return data(serializer)
+
+    profiled_data.profiled = True
+    BaseSerializer.data = property(profiled_data)
+
+
+class ProfilingMiddleware:
+    '''
+    Profiles PROFILING_SAMPLE_RATE fraction of requests. Sampled
+    responses get Server-Timing header with database and serializer
+    time, and a json log line with query count, most repeated query
+    fingerprints and response size. Log line of streaming response
+    is written when the stream is exhausted.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.PROFILING_SAMPLE_RATE > 0:
+            install_serializer_timer()
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = _local.profile = RequestProfile()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        profile.duration = perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing()
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                request, response, response.streaming_content, profile
+            )
+        else:
+            profile.log(request, response, len(response.content))
+        return response
+
+    def measure_stream(self, request, response, content, profile):
+        size = 0
+        started = perf_counter()
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            profile.log(request, response, size, perf_counter() - started)
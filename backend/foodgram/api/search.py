@@ -0,0 +1,76 @@
+import unicodedata
+from bisect import bisect_left
+
+from .cache import ingredients_reference
+
+
+def normalize(text):
+    '''
+    Prepares text for search comparison:
+    composes unicode characters, casefolds text, folds "ё" into "е"
+    and collapses whitespace.
+    '''
+    text = unicodedata.normalize('NFKC', text).casefold().replace('ё', 'е')
+    return ' '.join(text.split())
+
+
+class IngredientIndex:
+    '''
+    Immutable in-memory index of ingredients sorted by normalized name.
+    Prefix matches are found with binary search,
+    substring matches with a scan over normalized names.
+    '''
+    def __init__(self, ingredients, version=None):
+        self.version = version
+        entries = sorted(
+            (normalize(ingredient['name']), ingredient['id'], ingredient)
+            for ingredient in ingredients
+        )
+        self.keys = tuple(key for key, _, _ in entries)
+        self.ingredients = tuple(ingredient for _, _, ingredient in entries)
+
+    def search(self, query, limit):
+        '''
+        Returns up to limit ingredients matching query,
+        exact matches go first, then prefix and substring matches.
+        '''
+        query = normalize(query)
+        if not query:
+            return list(self.ingredients[:limit])
+        exact_matches, prefix_matches = [], []
+        position = bisect_left(self.keys, query)
+        while position < len(self.keys) and self.keys[position].startswith(
+            query
+        ):
+            if self.keys[position] == query:
+                exact_matches.append(position)
+            else:
+                prefix_matches.append(position)
+            position += 1
+        matches = exact_matches + prefix_matches
+        if len(matches) < limit:
+            matches += [
+                position for position, key in enumerate(self.keys)
+                if query in key and not key.startswith(query)
+            ]
+        return [self.ingredients[position] for position in matches[:limit]]
+
+
+class IngredientSearch:
+    '''
+    Holds process-wide ingredient index,
+    which is rebuilt when ingredients reference data changes.
+    '''
+    def __init__(self):
+        self._index = None
+
+    def get_index(self):
+        snapshot = ingredients_reference.get_snapshot()
+        index = self._index
+        if index is None or index.version != snapshot.version:
+            index = IngredientIndex(snapshot.data, snapshot.version)
+            self._index = index
+        return index
+
+
+ingredient_search = IngredientSearch()
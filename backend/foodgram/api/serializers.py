@@ -1,17 +1,32 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, RecipeTag, ShoplistRecipe, Tag)
-from users.models import Follow
-from .fields import Base64ImageField
-from .utils import add_ingredients_to_recipe, annotated_recipes
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoplistIngredient, Tag)
+from .cache import (RepresentationCache, ingredients_reference,
+                    tags_reference)
+from .fields import (Base64ImageField, CachedRepresentationField,
+                     ImageVariantsField, PrimaryKeyListField)
+from .membership import favorites, follows, shoplist
+from .metrics import RECIPE_RELATIONS_TOUCHED
+from .utils import (add_ingredients_to_recipe, get_recipes_limit,
+                    update_recipe_ingredients, update_recipe_tags)
+from .viewer import get_viewer, mark_authors, mark_recipes
 
 User = get_user_model()
 
 
+class SubscribeStatusListSerializer(serializers.ListSerializer):
+    '''Resolves viewer subscribe status of all users at once.'''
+    def to_representation(self, data):
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        mark_authors(authors, get_viewer(self.context))
+        return super().to_representation(authors)
+
+
 class GetFoodgramUserSerializer(UserSerializer):
 
     is_subscribed = serializers.BooleanField()
@@ -22,6 +37,12 @@ class GetFoodgramUserSerializer(UserSerializer):
             'email', 'id', 'username',
             'first_name', 'last_name', 'is_subscribed',
         )
+        list_serializer_class = SubscribeStatusListSerializer
+
+    def to_representation(self, user_obj):
+        if not hasattr(user_obj, 'is_subscribed'):
+            mark_authors([user_obj], get_viewer(self.context))
+        return super().to_representation(user_obj)
 
 
 class PostFoodgramUserSerializer(UserCreateSerializer):
@@ -65,42 +86,118 @@ class GetRecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class GetRecipeSerializer(serializers.ModelSerializer):
+class RecipeAuthorSerializer(GetFoodgramUserSerializer):
+    '''
+    Recipe author representation without viewer dependent
+    subscribe status, which is added by GetRecipeSerializer.
+    '''
+    class Meta(GetFoodgramUserSerializer.Meta):
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
 
+class RecipeRelationsSerializer(serializers.ModelSerializer):
+    '''
+    Nested part of recipe representation which does not depend
+    on viewer, cached per recipe in recipe_representations.
+    '''
     tags = TagSerializer(many=True)
-    author = GetFoodgramUserSerializer()
+    author = RecipeAuthorSerializer()
     ingredients = GetRecipeIngredientSerializer(
         source='ingredient_list', many=True
     )
+
+    class Meta:
+        model = Recipe
+        fields = ('tags', 'author', 'ingredients')
+
+
+recipe_representations = RepresentationCache(
+    'recipe',
+    RecipeRelationsSerializer,
+    Recipe.objects.select_related('author').prefetch_related(
+        'tags', 'ingredient_list__ingredient'
+    ),
+    references=(tags_reference, ingredients_reference)
+)
+
+
+def prepare_recipes(recipes, context):
+    '''
+    Attaches cached nested representations
+    and viewer state markers to recipes.
+    '''
+    recipe_representations.attach(recipes)
+    mark_recipes(recipes, get_viewer(context))
+
+
+class CachedRecipeListSerializer(serializers.ListSerializer):
+    '''
+    Reads nested representations of all recipes on the page
+    from representation cache and viewer state at once.
+    '''
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        prepare_recipes(recipes, self.context)
+        return super().to_representation(recipes)
+
+
+class CachedAuthorField(CachedRepresentationField):
+    '''Adds viewer subscribe status to cached author representation.'''
+    def to_representation(self, recipe):
+        return {
+            **super().to_representation(recipe),
+            'is_subscribed': recipe.author_is_subscribed
+        }
+
+
+class GetRecipeSerializer(serializers.ModelSerializer):
+    '''
+    Recipe representation assembled from cached nested part
+    and viewer dependent markers resolved for the page of recipes.
+    '''
+    tags = CachedRepresentationField()
+    author = CachedAuthorField()
+    ingredients = CachedRepresentationField()
     is_favorited = serializers.BooleanField()
     is_in_shopping_cart = serializers.BooleanField()
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author',
             'ingredients', 'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'images', 'text', 'cooking_time'
         )
+        list_serializer_class = CachedRecipeListSerializer
+
+    def to_representation(self, recipe):
+        if not hasattr(recipe, 'cached_representation'):
+            prepare_recipes([recipe], self.context)
+        return super().to_representation(recipe)
 
 
 class PostRecipeIngredientSerializer(serializers.Serializer):
     '''
     Ingredients serializer used as a child
     to validate ingredients data in PostRecipeSerializer.
+    Ingredient ids are resolved by the parent list field in bulk.
     '''
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=1)
 
 
 class PostRecipeSerializer(serializers.ModelSerializer):
 
-    ingredients = serializers.ListField(
+    ingredients = PrimaryKeyListField(
         child=PostRecipeIngredientSerializer(),
+        reference=ingredients_reference,
+        id_key='id',
         allow_empty=False
     )
-    tags = serializers.ListField(
-        child=serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all()),
+    tags = PrimaryKeyListField(
+        child=serializers.IntegerField(),
+        reference=tags_reference,
         allow_empty=False
     )
     image = Base64ImageField()
@@ -143,7 +240,7 @@ class PostRecipeSerializer(serializers.ModelSerializer):
             if item['id'] in unique_ingredients:
                 duplication_errors.add(
                     f'В рецепте повторяется ингредиент c номером '
-                    f'{item["id"]}.'
+                    f'{item["id"].pk}.'
                 )
             unique_ingredients.add(item['id'])
         if len(duplication_errors) > 0:
@@ -160,7 +257,7 @@ class PostRecipeSerializer(serializers.ModelSerializer):
             if item in unique_tags:
                 duplication_errors.add(
                     f'В рецепте повторяется тэг c номером '
-                    f'{item}.'
+                    f'{item.pk}.'
                 )
             unique_tags.add(item)
         if len(duplication_errors) > 0:
@@ -168,19 +265,7 @@ class PostRecipeSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, recipe_obj):
-        '''
-        Annotates represenatation of newly created recipe
-        with is_favorited and is_in_shoplist markers.
-        Also annotates recipe author with current user subscribe status.
-        '''
-        if self.context['request'].method == 'POST':
-            new_recipe = Recipe.objects.filter(pk=recipe_obj.pk)
-            current_user = self.context.get('request').user
-            new_recipe_annotated = annotated_recipes(
-                new_recipe, current_user, authors_num=1
-            ).first()
-            return GetRecipeSerializer(new_recipe_annotated).data
-        return GetRecipeSerializer(recipe_obj).data
+        return GetRecipeSerializer(recipe_obj, context=self.context).data
 
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
@@ -196,10 +281,28 @@ class PostRecipeSerializer(serializers.ModelSerializer):
         return recipe
 
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        super().update(instance, validated_data)
-        instance.ingredients.clear()
-        add_ingredients_to_recipe(instance, ingredients)
+        '''
+        Updates only ingredient and tag rows which actually changed,
+        number of touched rows is recorded in relations touched metric.
+        '''
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        touched = 0
+        with transaction.atomic():
+            super().update(instance, validated_data)
+            if ingredients is not None:
+                previous_amounts, touched = update_recipe_ingredients(
+                    instance, ingredients
+                )
+                ShoplistIngredient.objects.update_recipe(
+                    instance, previous_amounts, {
+                        ingredient['id'].pk: ingredient['amount']
+                        for ingredient in ingredients
+                    }
+                )
+            if tags is not None:
+                touched += update_recipe_tags(instance, tags)
+        RECIPE_RELATIONS_TOUCHED.observe(touched)
         return instance
 
 
@@ -211,80 +314,57 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
     favorites and shoplist catalogs.
     Also used to represent recipes on subscriptions page.
     '''
+    images = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
         read_only_fields = fields
 
 
 class FavoriteRecipeSerializer(ShortRecipeSerializer):
 
-    def validate(self, data):
+    def add_to_favorites(self, *args, **kwargs):
         '''
-        Validate that recipe is not in favorites when added to
-        or recipe is in favorites when deleted from it.
+        Adds recipe to favorites, a single insert tells
+        whether recipe was already there.
         '''
         user = self.context['request'].user
-        check_favorite = FavoriteRecipe.objects.filter(
-            user=user, recipe=self.instance
-        ).exists()
-        if self.context['request'].method == 'POST' and check_favorite:
+        if not favorites.add(user, self.instance):
             raise serializers.ValidationError(
                 {'detail':
                     'Данный рецепт уже добавлен в раздел любимых рецептов.'}
             )
-        elif self.context['request'].method == 'DELETE' and not check_favorite:
+
+    def remove_from_favorites(self):
+        user = self.context.get('request').user
+        if not favorites.remove(user, self.instance):
             raise serializers.ValidationError(
                 {'detail':
                     'Данного рецепта нет в разделе любимых рецептов.'}
             )
-        return data
-
-    def add_to_favorites(self, *args, **kwargs):
-        user = self.context['request'].user
-        FavoriteRecipe.objects.create(
-            user=user, recipe=self.instance
-        )
-
-    def remove_from_favorites(self):
-        user = self.context.get('request').user
-        get_object_or_404(
-            FavoriteRecipe, user=user, recipe=self.instance
-        ).delete()
 
 
 class ShoplistRecipeSerializer(ShortRecipeSerializer):
 
-    def validate(self, data):
+    def add_to_shoplist(self, *args, **kwargs):
         '''
-        Validate that recipe is not in shoplist when added to
-        or recipe is in favorites when deleted from it.
+        Adds recipe to shoplist, a single insert tells
+        whether recipe was already there.
         '''
         user = self.context['request'].user
-        check_object = ShoplistRecipe.objects.filter(
-            user=user, recipe=self.instance
-        ).exists()
-        if self.context['request'].method == 'POST' and check_object:
-            raise serializers.ValidationError(
-                {'detail': 'Вы уже добавляли данный рецепт в список покупок.'}
-            )
-        elif self.context['request'].method == 'DELETE' and not check_object:
+        if not shoplist.add(user, self.instance):
             raise serializers.ValidationError(
-                {'detail': 'Данного рецепта нет в списке покупок.'}
+                {'detail':
+                    'Вы уже добавляли данный рецепт в список покупок.'}
             )
-        return data
-
-    def add_to_shoplist(self, *args, **kwargs):
-        user = self.context['request'].user
-        ShoplistRecipe.objects.create(
-            user=user, recipe=self.instance
-        )
 
     def remove_from_shoplist(self, *args, **kwargs):
         user = self.context['request'].user
-        get_object_or_404(
-            ShoplistRecipe, user=user, recipe=self.instance
-        ).delete()
+        if not shoplist.remove(user, self.instance):
+            raise serializers.ValidationError(
+                {'detail': 'Данного рецепта нет в списке покупок.'}
+            )
 
 
 class SubscribeSerializer(GetFoodgramUserSerializer):
@@ -299,15 +379,19 @@ class SubscribeSerializer(GetFoodgramUserSerializer):
             'first_name', 'last_name', 'is_subscribed',
             'recipes', 'recipes_count'
         )
+        list_serializer_class = SubscribeStatusListSerializer
 
     def get_recipes(self, obj):
         '''
-        Limits returned recipes to three items for each followed user.
+        Limits returned recipes to three newest items for each followed user.
+        Uses recipes attached by prefetch_latest_recipes when available.
         '''
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit', 3
-        )
-        recipes_to_show = obj.recipes.all()[:int(recipes_limit)]
+        recipes_to_show = getattr(obj, 'latest_recipes', None)
+        if recipes_to_show is None:
+            recipes_limit = get_recipes_limit(self.context['request'])
+            recipes_to_show = obj.recipes.order_by(
+                '-pub_date', '-id'
+            )[:recipes_limit]
         serializer = ShortRecipeSerializer(recipes_to_show, many=True)
         return serializer.data
 
@@ -318,26 +402,14 @@ class SubscribeSerializer(GetFoodgramUserSerializer):
             raise serializers.ValidationError(
                 {'detail': 'Вы не можете подписаться сами на себя.'}
             )
-        elif Follow.objects.filter(
-            follower=current_user, author=followed_user
-        ).exists():
+        if not follows.add(current_user, followed_user):
             raise serializers.ValidationError(
                 {'detail': 'Вы уже подписаны на данного автора.'}
             )
-        Follow.objects.create(
-            follower=current_user, author=followed_user
-        )
 
     def unsubscribe(self, *args, **kwargs):
         current_user = self.context['request'].user
-        unfollowed_user = self.instance
-        try:
-            follow_object = Follow.objects.get(
-                follower=current_user, author=unfollowed_user
-            )
-        except Follow.DoesNotExist:
+        if not follows.remove(current_user, self.instance):
             raise serializers.ValidationError(
                 {'detail': 'Вы не подписаны на данного автора.'}
             )
-        else:
-            follow_object.delete()
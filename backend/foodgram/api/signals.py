@@ -0,0 +1,99 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoplistRecipe, Tag)
+from recipes.versions import RECIPES_VERSION, bump_version
+from users.models import Follow
+from .cache import ingredients_reference, tags_reference
+from .membership import favorites, follows, shoplist
+from .serializers import RecipeAuthorSerializer, recipe_representations
+
+User = get_user_model()
+
+
+def invalidate_recipe_representations(pks):
+    '''
+    Drops cached representations and marks recipes as changed
+    once current transaction commits.
+    '''
+    def invalidate():
+        recipe_representations.invalidate(pks)
+        bump_version(RECIPES_VERSION)
+
+    transaction.on_commit(invalidate)
+
+
+# Snapshots are reloaded once the write commits, otherwise another
+# worker could see the new version and reload uncommitted old rows.
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags_reference(**kwargs):
+    transaction.on_commit(tags_reference.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients_reference(**kwargs):
+    transaction.on_commit(ingredients_reference.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipe_representations([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=RecipeTag)
+def invalidate_recipe_relations(instance, **kwargs):
+    invalidate_recipe_representations([instance.recipe_id])
+
+
+def represented_author_state(user):
+    '''Returns loaded user fields shown in recipe representations.'''
+    return {
+        field: user.__dict__[field]
+        for field in RecipeAuthorSerializer.Meta.fields
+        if field in user.__dict__
+    }
+
+
+@receiver(post_init, sender=User)
+def remember_author_state(instance, **kwargs):
+    instance.represented_state = represented_author_state(instance)
+
+
+# Recipes are invalidated only when author fields shown in them change,
+# signup, login and password change keep cached recipes.
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, created, update_fields=None,
+                              **kwargs):
+    represented_fields = RecipeAuthorSerializer.Meta.fields
+    if created or (
+        update_fields and not set(update_fields) & set(represented_fields)
+    ):
+        return
+    previous_state = instance.represented_state
+    instance.represented_state = represented_author_state(instance)
+    if instance.represented_state == previous_state:
+        return
+    pks = list(instance.recipes.values_list('pk', flat=True))
+    if pks:
+        invalidate_recipe_representations(pks)
+
+
+# Delete receivers also fire for admin and cascade deletes,
+# which do not go through Membership.remove.
+@receiver([post_save, post_delete], sender=FavoriteRecipe)
+def invalidate_favorites(instance, **kwargs):
+    favorites.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=ShoplistRecipe)
+def invalidate_shoplist(instance, **kwargs):
+    shoplist.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_follows(instance, **kwargs):
+    follows.invalidate(instance.follower_id)
@@ -1,13 +1,19 @@
+import hashlib
+import json
+from collections import defaultdict
+
 from django.conf import settings
-from django.db.models import Exists, OuterRef, Prefetch
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
-from reportlab.rl_config import TTFSearchPath
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
-from recipes.models import FavoriteRecipe, RecipeIngredient, ShoplistRecipe
-from users.models import Follow, User
+from recipes.models import (Recipe, RecipeIngredient, RecipeTag,
+                            ShoplistIngredient)
+from .metrics import count_cache, observe_pdf
+from .pdf import StreamingPDF, buffered, register_font
 
 
 def add_ingredients_to_recipe(recipe, ingredients):
@@ -25,90 +31,244 @@ def add_ingredients_to_recipe(recipe, ingredients):
     )
 
 
-def annotate_subscribe_status(authors_queryset, follower_object):
-    '''Annotates author queryset with authorised user subscribe status.'''
-    is_subscribed = Follow.objects.filter(
-        follower=follower_object.pk,
-        author=OuterRef('pk')
-    )
-    return authors_queryset.annotate(is_subscribed=Exists(is_subscribed))
+def update_recipe_ingredients(recipe, ingredients):
+    '''
+    Applies difference between current and new recipe ingredients
+    with one bulk_create, one bulk_update and one delete at most.
+    Returns previous amounts by ingredient id and number of rows touched.
+    '''
+    current_rows = {
+        row.ingredient_id: row for row in recipe.ingredient_list.all()
+    }
+    amounts = {
+        ingredient['id'].pk: ingredient['amount']
+        for ingredient in ingredients
+    }
+    previous_amounts = {
+        ingredient_id: row.amount
+        for ingredient_id, row in current_rows.items()
+    }
+    inserted = [
+        RecipeIngredient(
+            recipe=recipe, ingredient_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in amounts.items()
+        if ingredient_id not in current_rows
+    ]
+    changed = []
+    for ingredient_id, row in current_rows.items():
+        if ingredient_id in amounts and row.amount != amounts[ingredient_id]:
+            row.amount = amounts[ingredient_id]
+            changed.append(row)
+    removed = [
+        row.pk for ingredient_id, row in current_rows.items()
+        if ingredient_id not in amounts
+    ]
+    if inserted:
+        RecipeIngredient.objects.bulk_create(inserted)
+    if changed:
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+    if removed:
+        RecipeIngredient.objects.filter(pk__in=removed).delete()
+    return previous_amounts, len(inserted) + len(changed) + len(removed)
 
 
-def annotate_favorites_and_shoplist(recipes_qset, user_object):
+def update_recipe_tags(recipe, tags):
     '''
-    Annotates recipe queryset with favorites and shoplist status
-    for authorised user.
+    Applies difference between current and new recipe tags
+    with one bulk_create and one delete at most.
+    Returns number of rows touched.
     '''
-    is_favorited = FavoriteRecipe.objects.filter(
-        user=user_object.pk,
-        recipe=OuterRef('pk')
-    )
-    is_in_shoplist_cart = ShoplistRecipe.objects.filter(
-        user=user_object.pk,
-        recipe=OuterRef('pk')
-    )
-    return recipes_qset.annotate(
-        is_favorited=Exists(is_favorited)
-    ).annotate(is_in_shopping_cart=Exists(is_in_shoplist_cart))
+    current_tags = set(recipe.tag_list.values_list('tag', flat=True))
+    tags = {tag.pk for tag in tags}
+    inserted = tags - current_tags
+    removed = current_tags - tags
+    if inserted:
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe=recipe, tag_id=tag) for tag in inserted]
+        )
+    if removed:
+        RecipeTag.objects.filter(recipe=recipe, tag__in=removed).delete()
+    return len(inserted) + len(removed)
 
 
-def annotated_recipes(recipes, current_user, authors_num=None):
+def get_recipes_limit(request, default=3):
     '''
-    Annotates recipes with is_favorited and is_in_shoplist markers.
-    Also annotates recipe author with authorised user subscribe status.
+    Returns number of recipes to show for each followed author
+    from recipes_limit query parameter.
     '''
-    if authors_num == 1:
-        authors_annotated = Prefetch(
-            'author', queryset=annotate_subscribe_status(
-                User.objects.filter(pk=current_user.pk), current_user
-            )
+    try:
+        return max(int(request.query_params.get('recipes_limit', default)), 0)
+    except ValueError:
+        return default
+
+
+def prefetch_latest_recipes(authors, recipes_limit):
+    '''
+    Attaches recipes_limit newest recipes to each author as latest_recipes
+    with a single query, which numbers recipes of every author
+    with ROW_NUMBER window function and keeps only the first ones.
+    '''
+    authors = list(authors)
+    recipes_by_author = defaultdict(list)
+    if authors and recipes_limit:
+        ranked_recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time', 'author'
+        ).annotate(author_position=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        ))
+        sql, params = ranked_recipes.query.sql_with_params()
+        latest_recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked_recipes '
+            f'WHERE author_position <= %s ORDER BY author_id, author_position',
+            (*params, recipes_limit)
         )
-    else:
-        authors_annotated = Prefetch(
-            'author', queryset=annotate_subscribe_status(
-                User.objects.all(), current_user
+        for recipe in latest_recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.latest_recipes = recipes_by_author[author.pk]
+    return authors
+
+
+def explain_json(queryset):
+    '''
+    Returns PostgreSQL query plan of queryset as decoded json.
+    QuerySet.explain is not used, on Django 2.2 it joins json
+    already decoded by psycopg2 into python repr.
+    '''
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan
+
+
+def shoplist_ingredients(user):
+    '''
+    Returns shoplist ingredient totals of the user
+    ordered by ingredient name.
+    '''
+    return ShoplistIngredient.objects.filter(user=user.pk).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        ingredient_total=F('amount')
+    ).order_by('ingredient__name')
+
+
+def render_shoplist_pages(shoplist_ingredients):
+    '''
+    Yields pdf document that contains authorised user shoplist ingredients
+    in human-readable format page by page.
+    '''
+    begin_position_x, begin_position_y = 30, 730
+    document = StreamingPDF(register_font(), title='Список покупок')
+    try:
+        yield document.begin()
+        document.draw_string(
+            begin_position_x, begin_position_y + 40, 25, 'Список покупок: '
+        )
+        for number, item in enumerate(shoplist_ingredients, start=1):
+            if begin_position_y < 100:
+                begin_position_y = 730
+                yield document.show_page()
+            document.draw_string(
+                begin_position_x,
+                begin_position_y,
+                18,
+                f'{number}: {item["ingredient__name"]} - '
+                f'{item["ingredient_total"]} '
+                f'{item["ingredient__measurement_unit"]}'
             )
+            begin_position_y -= 30
+        yield document.show_page()
+        yield document.end()
+    finally:
+        document.close()
+
+
+def shoplist_digest(shoplist_ingredients):
+    '''
+    Returns hash of shoplist ingredients rows,
+    used to address rendered shoplist documents.
+    Rows are fed to the hash one by one and are not kept in memory.
+    '''
+    digest = hashlib.sha256()
+    for item in shoplist_ingredients.iterator():
+        digest.update(
+            f'{item["ingredient__name"]}\x1f'
+            f'{item["ingredient__measurement_unit"]}\x1f'
+            f'{item["ingredient_total"]}\x1e'.encode()
         )
-    recipes_with_prefetche = recipes.prefetch_related(
-        authors_annotated, 'tags', 'ingredients'
-    )
-    return annotate_favorites_and_shoplist(
-        recipes_with_prefetche, current_user
-    )
+    return digest.hexdigest()
 
 
-def shoplist_to_pdf(shoplist_ingredients):
+def cache_rendered_document(chunks, cache_key):
     '''
-    Renders pdf file that contains
-    authorised user shoplist ingredients in human-readable format.
+    Passes rendered document chunks through and stores the whole document
+    in shoplists cache unless it exceeds SHOPLIST_PDF_CACHE_MAX_SIZE bytes.
     '''
-    begin_position_x, begin_position_y = 30, 730
-    response = HttpResponse(content_type='application/pdf')
+    document = []
+    document_size = 0
+    for chunk in chunks:
+        document_size += len(chunk)
+        if document is not None:
+            document.append(chunk)
+            if document_size > settings.SHOPLIST_PDF_CACHE_MAX_SIZE:
+                document = None
+        yield chunk
+    if document is not None:
+        caches['shoplists'].set(cache_key, b''.join(document))
+
+
+def shoplist_to_pdf(shoplist_ingredients, cache_key=None):
+    '''
+    Streams pdf file with authorised user shoplist ingredients,
+    pages are sent to client in blocks of SHOPLIST_PDF_BUFFER_SIZE bytes
+    as soon as they are rendered.
+    If cache_key is given, rendered document is saved to shoplists cache.
+    '''
+    chunks = observe_pdf(buffered(
+        render_shoplist_pages(shoplist_ingredients),
+        settings.SHOPLIST_PDF_BUFFER_SIZE
+    ))
+    if cache_key is not None:
+        chunks = cache_rendered_document(chunks, cache_key)
+    response = StreamingHttpResponse(chunks, content_type='application/pdf')
     response['Content-Disposition'] = (
         'attachment; filename="shopping_list.pdf"'
     )
-    plane = canvas.Canvas(response, pagesize=A4)
-    TTFSearchPath.append(str(settings.BASE_DIR) + '/reportlabs/fonts')
-    pdfmetrics.registerFont(ttfonts.TTFont('FreeSans', 'FreeSans.ttf'))
-    plane.setFont('FreeSans', 25)
-    plane.setTitle('Список покупок')
-    plane.drawString(
-        begin_position_x, begin_position_y + 40, 'Список покупок: '
-    )
-    plane.setFont('FreeSans', 18)
-    for number, item in enumerate(shoplist_ingredients, start=1):
-        if begin_position_y < 100:
-            begin_position_y = 730
-            plane.showPage()
-            plane.setFont('FreeSans', 18)
-        plane.drawString(
-            begin_position_x,
-            begin_position_y,
-            f'{number}: {item["ingredient__name"]} - '
-            f'{item["ingredient_total"]} '
-            f'{item["ingredient__measurement_unit"]}'
-        )
-        begin_position_y -= 30
-    plane.showPage()
-    plane.save()
+    return response
+
+
+def cached_shoplist_to_pdf(request, shoplist_ingredients):
+    '''
+    Serves shoplist pdf file from cache of rendered documents
+    addressed by shoplist ingredients hash, so cached document is
+    replaced as soon as shoplist changes.
+    Replies with 304 status if client already has the same document,
+    shoplist is read once more only if document has to be rendered.
+    '''
+    digest = shoplist_digest(shoplist_ingredients)
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f'shoplist-pdf:{digest}'
+        document = caches['shoplists'].get(cache_key)
+        count_cache('shoplist_pdf', hits=document is not None,
+                    misses=document is None)
+        if document is None:
+            response = shoplist_to_pdf(
+                shoplist_ingredients.iterator(), cache_key
+            )
+        else:
+            response = HttpResponse(document, content_type='application/pdf')
+            response['Content-Disposition'] = (
+                'attachment; filename="shopping_list.pdf"'
+            )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
     return response
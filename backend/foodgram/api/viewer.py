@@ -0,0 +1,61 @@
+from django.contrib.auth.models import AnonymousUser
+
+from .membership import favorites, follows, shoplist
+
+
+class ViewerState:
+    '''
+    Ids of recipes favorited and added to shoplist by viewer
+    and ids of authors followed by viewer.
+    '''
+    def __init__(self, favorites=(), shoplist=(), follows=()):
+        self.favorites = frozenset(favorites)
+        self.shoplist = frozenset(shoplist)
+        self.follows = frozenset(follows)
+
+
+def get_viewer(context):
+    '''Returns user of the request from serializer context.'''
+    request = context.get('request')
+    return AnonymousUser() if request is None else request.user
+
+
+def resolve_viewer_state(user, recipe_ids=(), author_ids=()):
+    '''
+    Reads viewer state limited to given recipes and authors
+    from per-user membership sets, anonymous viewer needs no lookups.
+    '''
+    if not user.is_authenticated:
+        return ViewerState()
+    favorite_ids = shoplist_ids = follow_ids = frozenset()
+    if recipe_ids:
+        favorite_ids = favorites.get(user.pk) & set(recipe_ids)
+        shoplist_ids = shoplist.get(user.pk) & set(recipe_ids)
+    if author_ids:
+        follow_ids = follows.get(user.pk) & set(author_ids)
+    return ViewerState(favorite_ids, shoplist_ids, follow_ids)
+
+
+def mark_recipes(recipes, user):
+    '''
+    Sets is_favorited, is_in_shopping_cart
+    and author_is_subscribed attributes of recipes.
+    '''
+    state = resolve_viewer_state(
+        user,
+        {recipe.pk for recipe in recipes},
+        {recipe.author_id for recipe in recipes}
+    )
+    for recipe in recipes:
+        recipe.is_favorited = recipe.pk in state.favorites
+        recipe.is_in_shopping_cart = recipe.pk in state.shoplist
+        recipe.author_is_subscribed = recipe.author_id in state.follows
+
+
+def mark_authors(authors, user):
+    '''Sets is_subscribed attribute of users.'''
+    state = resolve_viewer_state(
+        user, author_ids={author.pk for author in authors}
+    )
+    for author in authors:
+        author.is_subscribed = author.pk in state.follows
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -8,24 +9,31 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.versions import RECIPES_VERSION
 from users.models import Follow
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import IsAdminOrOwnerMixin
+from .cache import ingredients_reference, tags_reference
+from .filters import RecipeFilter
+from .mixins import (AnonymousResponseCacheMixin, ConditionalGetMixin,
+                     CursorPaginationMixin, IsAdminOrOwnerMixin)
+from .pagination import RecipeCursorPagination, SubscriptionCursorPagination
+from .search import ingredient_search
 from .serializers import (FavoriteRecipeSerializer, GetFoodgramUserSerializer,
                           GetRecipeSerializer, IngredientSerializer,
                           PostFoodgramUserSerializer, PostRecipeSerializer,
                           ShoplistRecipeSerializer, SubscribeSerializer,
                           TagSerializer)
-from .utils import (annotate_subscribe_status, annotated_recipes,
-                    shoplist_to_pdf)
+from .utils import (cached_shoplist_to_pdf, get_recipes_limit,
+                    prefetch_latest_recipes, shoplist_ingredients)
 
 User = get_user_model()
 
 
-class FoodgramUserViewSet(UserViewSet):
+class FoodgramUserViewSet(CursorPaginationMixin, UserViewSet):
     serializer_class = GetFoodgramUserSerializer
-    queryset = User.objects.all().prefetch_related('recipes')
+    queryset = User.objects.order_by('pk')
+    cursor_pagination_class = SubscriptionCursorPagination
+    cursor_pagination_actions = ('subscriptions',)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -50,12 +58,10 @@ class FoodgramUserViewSet(UserViewSet):
             subscriptions = Follow.objects.filter(follower=user.pk)
             queryset = queryset.filter(
                 pk__in=subscriptions.values_list('author')
-            ).annotate(recipes_count=Count('recipes'))
+            )
         elif self.action in ("subscribe", "unsubscribe"):
-            queryset = queryset.filter(
-                pk=self.kwargs["id"]
-            ).annotate(recipes_count=Count('recipes'))
-        return annotate_subscribe_status(queryset, user)
+            queryset = queryset.filter(pk=self.kwargs["id"])
+        return queryset
 
     @action(['GET'], detail=False)
     def me(self, request):
@@ -68,10 +74,13 @@ class FoodgramUserViewSet(UserViewSet):
     def subscriptions(self, *args, **kwargs):
         subscriptions = self.get_queryset()
         page = self.paginate_queryset(subscriptions)
+        authors = prefetch_latest_recipes(
+            subscriptions if page is None else page,
+            get_recipes_limit(self.request)
+        )
+        serializer = self.get_serializer(authors, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(subscriptions, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(['POST'], detail=True)
@@ -91,25 +100,54 @@ class FoodgramUserViewSet(UserViewSet):
         return Response(serializer.data, status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(IsAdminOrOwnerMixin, viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, IsAdminOrOwnerMixin,
+                 viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    reference = tags_reference
+    version_names = (tags_reference.name,)
+
+    def list(self, request, *args, **kwargs):
+        '''Serves pre-rendered list from reference data cache.'''
+        return HttpResponse(
+            self.reference.get_snapshot().content,
+            content_type='application/json'
+        )
 
 
 class IngredientViewSet(TagViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    reference = ingredients_reference
+    version_names = (ingredients_reference.name,)
+
+    def list(self, request, *args, **kwargs):
+        '''
+        Serves ingredients from reference data cache,
+        name query parameter returns ranked autocomplete matches
+        from in-memory search index.
+        '''
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_search.get_index().search(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        ))
 
 
-class RecipeViewSet(IsAdminOrOwnerMixin, viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                    CursorPaginationMixin, IsAdminOrOwnerMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = PostRecipeSerializer
+    version_names = (
+        RECIPES_VERSION, tags_reference.name, ingredients_reference.name
+    )
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = RecipeFilter
-    ordering = ('-pub_date',)
+    ordering = ('-pub_date', '-id')
+    cursor_pagination_class = RecipeCursorPagination
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -120,11 +158,6 @@ class RecipeViewSet(IsAdminOrOwnerMixin, viewsets.ModelViewSet):
             return ShoplistRecipeSerializer
         return super().get_serializer_class()
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        current_user = self.request.user
-        return annotated_recipes(queryset, current_user)
-
     @action(['POST'], detail=True)
     def favorite(self, *args, **kwargs):
         favorite_recipe = self.get_object()
@@ -172,17 +205,11 @@ class RecipeViewSet(IsAdminOrOwnerMixin, viewsets.ModelViewSet):
     @action(['GET'], detail=False)
     def download_shopping_cart(self, request):
         '''
-        Builds recipe shoplist ingredients dictionary
+        Reads authorised user shoplist ingredients
         with accumulated measurement unit values and calls
         pdf file renderer which return a human-friendly representation
         of shoplist ingredients.
+        Rendered files are cached and revalidated with ETag.
         '''
-        user = request.user
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoplist_users__user=user.pk
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(ingredient_total=Sum('amount'))
-        return shoplist_to_pdf(ingredients)
+        ingredients = shoplist_ingredients(request.user)
+        return cached_shoplist_to_pdf(request, ingredients)
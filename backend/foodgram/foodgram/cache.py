@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    '''
+    File based cache whose add is atomic across processes.
+    Entry is written to a temporary file which is then hard linked
+    under entry name, linking fails if another process created it first.
+    '''
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        try:
+            with open(fname, 'rb') as file:
+                # Expired entry is deleted here.
+                if not self._is_expired(file):
+                    return False
+        except FileNotFoundError:
+            pass
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as file:
+                self._write_content(file, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+
+class PersistentFileBasedCache(AtomicFileBasedCache):
+    '''
+    Atomic file based cache which never culls entries,
+    they are kept until overwritten, deleted or expired.
+    Writes do not list cache directory.
+    '''
+    def _cull(self):
+        pass
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -28,12 +29,14 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'django_filters',
     'djoser',
-    'api',
-    'users',
-    'recipes',
+    'api.apps.ApiConfig',
+    'users.apps.UsersConfig',
+    'recipes.apps.RecipesConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,3 +126,111 @@ MEDIA_URL = '/media/foodgram/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.User'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', default='foodgram.cache.AtomicFileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
+    },
+    # Version stamps are kept until bumped, their cache is never culled.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            default='foodgram.cache.PersistentFileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_versions')
+        ),
+        'TIMEOUT': None,
+    },
+    'shoplists': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shoplists',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('SHOPLIST_PDF_CACHE_ENTRIES', default=256)
+            ),
+        },
+    },
+}
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50)
+)
+
+SHOPLIST_PDF_BUFFER_SIZE = int(
+    os.getenv('SHOPLIST_PDF_BUFFER_SIZE', default=64 * 1024)
+)
+SHOPLIST_PDF_CACHE_MAX_SIZE = int(
+    os.getenv('SHOPLIST_PDF_CACHE_MAX_SIZE', default=512 * 1024)
+)
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', default=40 * 1000 * 1000)
+)
+IMAGE_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+IMAGE_VARIANTS_FORMAT = os.getenv('IMAGE_VARIANTS_FORMAT', default='WEBP')
+IMAGE_VARIANTS_QUALITY = int(
+    os.getenv('IMAGE_VARIANTS_QUALITY', default=80)
+)
+
+REPRESENTATION_CACHE_TIMEOUT = int(
+    os.getenv('REPRESENTATION_CACHE_TIMEOUT', default=24 * 60 * 60)
+)
+
+MEMBERSHIP_CACHE_TIMEOUT = int(
+    os.getenv('MEMBERSHIP_CACHE_TIMEOUT', default=10 * 60)
+)
+
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', default=60))
+
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=5 * 60)
+)
+RESPONSE_CACHE_LOCK_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT', default=10)
+)
+RESPONSE_CACHE_STALE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_STALE_TIMEOUT', default=5 * 60)
+)
+RESPONSE_CACHE_WAIT_TIMEOUT = float(
+    os.getenv('RESPONSE_CACHE_WAIT_TIMEOUT', default=2)
+)
+
+PROFILING_SAMPLE_RATE = float(
+    os.getenv('PROFILING_SAMPLE_RATE', default=0)
+)
+PROFILING_TOP_DUPLICATES = int(
+    os.getenv('PROFILING_TOP_DUPLICATES', default=5)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
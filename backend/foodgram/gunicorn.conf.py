@@ -0,0 +1,34 @@
+import os
+import shutil
+
+# Workers write metrics to files in this directory, it is set here and
+# not in the image, so management commands keep in-process metrics.
+# It has to be set before prometheus_client is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram_metrics')
+
+from prometheus_client import (CollectorRegistry,  # noqa: E402
+                               multiprocess, start_http_server)
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', default=9100))
+
+
+def on_starting(server):
+    '''Clears metrics left by workers of previous master process.'''
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def when_ready(server):
+    '''
+    Serves metrics aggregated over all workers on METRICS_PORT,
+    a separate listener not reachable through the site.
+    '''
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+
+
+def child_exit(server, worker):
+    '''Stops exporting gauges of exited worker.'''
+    multiprocess.mark_process_dead(worker.pid)
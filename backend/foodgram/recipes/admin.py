@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.template.defaultfilters import truncatechars
 
-from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                     ShoplistIngredient, Tag)
 
 
 class AdminTag(admin.ModelAdmin):
@@ -28,6 +29,7 @@ class AdminRecipe(admin.ModelAdmin):
         'get_short_text', 'cooking_time', 'get_number_of_fans'
     )
     readonly_fields = ('pub_date', 'get_number_of_fans',)
+    list_select_related = ('author',)
     inlines = [
         RecipeIngredientInline,
         RecipeTagInline
@@ -37,6 +39,12 @@ class AdminRecipe(admin.ModelAdmin):
         'tags__name', 'tags__slug'
     )
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoplistIngredient.objects.rebuild(
+            form.instance.shoplist_users.values_list('user', flat=True)
+        )
+
     def get_author_username(self, obj):
         return obj.author.username
     get_author_username.short_description = "Автор"
@@ -46,7 +54,7 @@ class AdminRecipe(admin.ModelAdmin):
     get_short_text.short_description = "Описание рецепта"
 
     def get_number_of_fans(self, obj):
-        return obj.fans.count()
+        return obj.fans_count
     get_number_of_fans.short_description = "Число добавлений в Избранное"
 
 
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+def variants_suffix():
+    '''
+    Returns name suffix of image variants built with current settings.
+    Suffix contains hash of variant sizes, format and quality,
+    so variants built with other settings never share names
+    and can be cached by clients forever.
+    '''
+    image_format = settings.IMAGE_VARIANTS_FORMAT
+    fingerprint = hashlib.sha256(repr((
+        sorted(VARIANTS.items()), image_format,
+        settings.IMAGE_VARIANTS_QUALITY
+    )).encode()).hexdigest()[:8]
+    return f'{fingerprint}.{EXTENSIONS[image_format]}'
+
+
+def variant_name(image_name, variant, suffix=None):
+    '''Returns storage name of image variant kept next to the original.'''
+    root = os.path.splitext(image_name)[0]
+    return f'{root}_{variant}_{suffix or variants_suffix()}'
+
+
+def variant_names(image_name, suffixes):
+    '''Returns names of image variants with every given suffix.'''
+    return {
+        variant_name(image_name, variant, suffix)
+        for variant in VARIANTS
+        for suffix in suffixes
+    }
+
+
+def build_variants(image_name, storage=default_storage, force=False):
+    '''
+    Saves resized copies of image in every variant size
+    and returns suffix of their names.
+    Variants are named by image content and settings,
+    so existing variants are kept unless force is set.
+    '''
+    image_format = settings.IMAGE_VARIANTS_FORMAT
+    suffix = variants_suffix()
+    names = [variant_name(image_name, variant, suffix) for variant in VARIANTS]
+    if not force and all(storage.exists(name) for name in names):
+        return suffix
+    with storage.open(image_name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA') or image_format == 'JPEG':
+        image = image.convert('RGB')
+    for name, size in zip(names, VARIANTS.values()):
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        content = BytesIO()
+        resized.save(
+            content, image_format,
+            quality=settings.IMAGE_VARIANTS_QUALITY
+        )
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content.getvalue()))
+    return suffix
+
+
+class ImageWorker:
+    '''
+    Runs image processing tasks one by one in a daemon thread
+    of the current process, so they are kept off the request path.
+    Thread is started on first submitted task.
+    '''
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, function, *args):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='image-worker', daemon=True
+                )
+                self.thread.start()
+        self.tasks.put((function, args))
+
+    def run(self):
+        while True:
+            function, args = self.tasks.get()
+            try:
+                function(*args)
+            except Exception:
+                logger.exception('Image task %s%r failed.', function, args)
+            finally:
+                close_old_connections()
+                self.tasks.task_done()
+
+
+image_worker = ImageWorker()
@@ -0,0 +1,504 @@
+import base64
+import io
+import json
+import math
+import tempfile
+import time
+from itertools import count
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.urls import router_v1
+from recipes.images import image_worker
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.seeding import SEED_PASSWORD, seed_dataset
+from users.models import User
+
+SKIPPED_ROUTES = {
+    ('users', 'activation'): 'needs uid and token from activation email',
+    ('users', 'resend_activation'): 'sends activation email',
+    ('users', 'reset_password'): 'sends password reset email',
+    ('users', 'reset_password_confirm'): 'needs token from reset email',
+    ('users', 'set_username'): 'changes login of the benchmark user',
+    ('users', 'reset_username'): 'sends username reset email',
+    ('users', 'reset_username_confirm'): 'needs token from reset email',
+}
+
+# Scenario name: (max queries, p50 ms, p95 ms).
+BUDGETS = {
+    'users.list': (3, 20, 40),
+    'users.create': (5, 300, 400),
+    'users.me': (2, 20, 40),
+    'users.subscriptions': (4, 40, 80),
+    'users.retrieve': (2, 20, 40),
+    'users.update': (6, 30, 60),
+    'users.partial_update': (4, 30, 60),
+    'users.destroy': (14, 300, 400),
+    'users.set_password': (3, 500, 700),
+    'users.subscribe': (9, 40, 80),
+    'users.unsubscribe': (8, 40, 80),
+    'tags.list': (0, 5, 10),
+    'tags.retrieve': (1, 15, 30),
+    'tags.create': (5, 30, 60),
+    'tags.update': (6, 30, 60),
+    'tags.partial_update': (6, 30, 60),
+    'tags.destroy': (5, 30, 60),
+    'ingredients.list': (0, 5, 10),
+    'ingredients.list.search': (0, 10, 20),
+    'ingredients.retrieve': (1, 15, 30),
+    'ingredients.create': (2, 20, 40),
+    'ingredients.update': (3, 20, 40),
+    'ingredients.partial_update': (3, 20, 40),
+    'ingredients.destroy': (6, 30, 60),
+    'recipes.list': (3, 40, 80),
+    'recipes.list.anonymous': (0, 10, 20),
+    'recipes.list.cursor': (2, 40, 80),
+    'recipes.list.tags': (3, 60, 120),
+    'recipes.list.tags_all': (3, 60, 120),
+    'recipes.list.author': (4, 40, 80),
+    'recipes.list.is_favorited': (3, 40, 80),
+    'recipes.list.is_in_shopping_cart': (3, 40, 80),
+    'recipes.retrieve': (2, 30, 60),
+    'recipes.retrieve.anonymous': (0, 10, 20),
+    'recipes.create': (13, 80, 160),
+    'recipes.update': (18, 100, 200),
+    'recipes.partial_update': (11, 80, 160),
+    'recipes.destroy': (12, 60, 120),
+    'recipes.favorite': (7, 40, 80),
+    'recipes.remove_favorite': (6, 40, 80),
+    'recipes.shopping_cart': (12, 60, 120),
+    'recipes.remove_from_shopping_cart': (10, 60, 120),
+    'recipes.download_shopping_cart': (2, 20, 40),
+}
+
+
+def percentile(values, percent):
+    '''Returns nearest-rank percentile of values.'''
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def small_image():
+    '''Returns base64 data url of 1x1 png image.'''
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class DeferredTasks:
+    '''
+    Replaces image worker during benchmark, so that background tasks
+    run between measured requests instead of competing with them.
+    '''
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, function, *args):
+        self.tasks.append((function, args))
+
+    def run(self):
+        while self.tasks:
+            function, args = self.tasks.pop(0)
+            function(*args)
+
+
+deferred_tasks = DeferredTasks()
+
+
+class Scenario:
+    '''
+    Measured request of route named by the first two parts of name.
+    prepare is called before every run with run number and is not
+    measured, its result fills {prepared} placeholder of path.
+    data is either a dict or a function of run number.
+    '''
+    def __init__(self, name, client, method, path, data=None, status=200,
+                 prepare=None):
+        self.name = name
+        self.route = tuple(name.split('.')[:2])
+        self.client = client
+        self.method = method
+        self.path = path
+        self.data = data
+        self.status = status
+        self.prepare = prepare
+
+    def run(self, number):
+        prepared = self.prepare(number) if self.prepare else None
+        path = self.path.format(prepared=prepared)
+        data = self.data(number) if callable(self.data) else self.data
+        deferred_tasks.run()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, self.method)(
+                path, data, format='json'
+            )
+            elapsed = time.perf_counter() - started
+        if response.status_code != self.status:
+            raise CommandError(
+                f'{self.name}: {self.method.upper()} {path} returned '
+                f'{response.status_code}, expected {self.status}: '
+                f'{response.content[:300]!r}'
+            )
+        return len(queries), elapsed * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds test database and measures query count and latency "
+        "of every API route against budgets. Writes JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--runs', type=int, default=20,
+            help='Measured runs per scenario.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Unmeasured runs per scenario.'
+        )
+        parser.add_argument(
+            '--latency-scale', type=float, default=1.0,
+            help='Multiplier of latency budgets for slower machines.'
+        )
+        parser.add_argument(
+            '--output', help='Path of JSON report, stdout if omitted.'
+        )
+        parser.add_argument(
+            '--no-fail', action='store_true',
+            help='Report budget breaches without failing.'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        caches = {
+            **settings.CACHES,
+            'default': {
+                **settings.CACHES['default'],
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark',
+            },
+        }
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, CACHES=caches,
+                                      ALLOWED_HOSTS=['testserver']), \
+                    mock.patch.object(image_worker, 'submit',
+                                      deferred_tasks.submit):
+                report = self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        content = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(content + '\n')
+        else:
+            self.stdout.write(content)
+        failed = [
+            name for name, result in report['scenarios'].items()
+            if result['breaches']
+        ]
+        if failed and not options['no_fail']:
+            raise CommandError('Budgets exceeded: ' + ', '.join(failed))
+
+    def benchmark(self, options):
+        started = time.monotonic()
+        seed_dataset(
+            users=options['users'], recipes=options['recipes'],
+            random_seed=options['seed']
+        )
+        self.stderr.write(f'Seeded in {time.monotonic() - started:.1f}s.')
+        dataset = {
+            model.__name__: model.objects.count()
+            for model in (User, Recipe, Ingredient, Tag)
+        }
+        scenarios = self.get_scenarios()
+        self.check_coverage(scenarios)
+        results = {}
+        for scenario in scenarios:
+            numbers = count()
+            for _ in range(options['warmup']):
+                scenario.run(next(numbers))
+            runs = [
+                scenario.run(next(numbers)) for _ in range(options['runs'])
+            ]
+            results[scenario.name] = self.evaluate(
+                scenario, runs, options['latency_scale']
+            )
+            self.stderr.write(
+                '{}: {queries} queries, p50 {p50_ms} ms, p95 {p95_ms} ms'
+                .format(scenario.name, **results[scenario.name])
+            )
+        return {
+            'vendor': connection.vendor,
+            'dataset': dataset,
+            'runs': options['runs'],
+            'scenarios': results,
+        }
+
+    def evaluate(self, scenario, runs, latency_scale):
+        queries = max(run[0] for run in runs)
+        latencies = [run[1] for run in runs]
+        result = {
+            'method': scenario.method.upper(),
+            'queries': queries,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'breaches': [],
+        }
+        budget = BUDGETS.get(scenario.name)
+        if budget is None:
+            result['breaches'].append('no budget')
+            return result
+        max_queries, p50_ms, p95_ms = budget
+        result['budget'] = {
+            'queries': max_queries,
+            'p50_ms': p50_ms * latency_scale,
+            'p95_ms': p95_ms * latency_scale,
+        }
+        for key, limit in result['budget'].items():
+            if result[key] > limit:
+                result['breaches'].append(f'{key} {result[key]} > {limit}')
+        return result
+
+    def check_coverage(self, scenarios):
+        routes = {
+            (basename, action)
+            for prefix, viewset, basename in router_v1.registry
+            for route in router_v1.get_routes(viewset)
+            for action in route.mapping.values()
+        }
+        uncovered = routes - set(SKIPPED_ROUTES) - {
+            scenario.route for scenario in scenarios
+        }
+        if uncovered:
+            raise CommandError('Routes without scenarios: ' + ', '.join(
+                f'{basename}.{action}'
+                for basename, action in sorted(uncovered)
+            ))
+
+    def get_client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def setup_fixtures(self):
+        '''
+        Picks viewer with the largest shoplist, the most productive
+        author and creates admin and a recipe owned by viewer.
+        '''
+        self.viewer = User.objects.annotate(
+            total=Count('shoplist_recipes')
+        ).order_by('-total', 'pk').first()
+        self.author = User.objects.exclude(pk=self.viewer.pk).order_by(
+            '-recipes_count', 'pk'
+        ).first()
+        admin, _ = User.objects.get_or_create(
+            username='benchmark-admin',
+            defaults={
+                'email': 'benchmark-admin@example.com',
+                'first_name': 'Benchmark', 'last_name': 'Admin',
+                'is_staff': True, 'is_superuser': True,
+            }
+        )
+        admin.set_password(SEED_PASSWORD)
+        admin.save()
+        self.anonymous = self.get_client()
+        self.client = self.get_client(self.viewer)
+        self.admin = self.get_client(admin)
+        self.recipe = Recipe.objects.exclude(
+            author=self.viewer
+        ).order_by('pk').first()
+        self.tag, self.other_tag = Tag.objects.order_by('pk')[:2]
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.image = small_image()
+        self.own_recipe = self.create_recipe(-1)
+
+    def recipe_data(self, number):
+        return {
+            'ingredients': [
+                {'id': self.ingredient_ids[number % 50 + offset], 'amount': 10}
+                for offset in (0, 50, 100)
+            ],
+            'tags': [self.tag.pk],
+            'image': self.image,
+            'name': f'Бенчмарк {number}',
+            'text': 'Описание рецепта.',
+            'cooking_time': number % 100 + 1,
+        }
+
+    def create_recipe(self, number):
+        return self.client.post(
+            '/api/recipes/', self.recipe_data(number), format='json'
+        ).data['id']
+
+    def create_user(self, number):
+        return User.objects.create_user(
+            username=f'benchmark{number}',
+            email=f'benchmark{number}@example.com',
+            first_name='Benchmark', last_name='User',
+            password=SEED_PASSWORD
+        ).pk
+
+    def create_tag(self, number):
+        return Tag.objects.create(
+            name=f'Метка {number}', color=f'#{number:06x}',
+            slug=f'benchmark-{number}'
+        ).pk
+
+    def create_ingredient(self, number):
+        return Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        ).pk
+
+    def undo(self, method, path):
+        '''Returns prepare function reverting toggle request.'''
+        return lambda number: getattr(self.client, method)(path)
+
+    def get_scenarios(self):
+        self.setup_fixtures()
+        return [
+            *self.get_user_scenarios(),
+            *self.get_reference_scenarios('tags', self.tag.pk, lambda n: {
+                'name': f'Тег {n}', 'color': f'#{0x100000 + n:06x}',
+                'slug': f'tag-{n}',
+            }, self.create_tag),
+            *self.get_reference_scenarios(
+                'ingredients', self.ingredient_ids[0], lambda n: {
+                    'name': f'Продукт {n}', 'measurement_unit': 'г',
+                }, self.create_ingredient
+            ),
+            Scenario('ingredients.list.search', self.anonymous, 'get',
+                     '/api/ingredients/?name=мол'),
+            *self.get_recipe_scenarios(),
+        ]
+
+    def get_user_scenarios(self):
+        viewer = f'/api/users/{self.viewer.pk}/'
+        subscribe = f'/api/users/{self.author.pk}/subscribe/'
+        password = {
+            'new_password': SEED_PASSWORD, 'current_password': SEED_PASSWORD
+        }
+        return [
+            Scenario('users.list', self.client, 'get', '/api/users/?limit=6'),
+            Scenario('users.create', self.anonymous, 'post', '/api/users/',
+                     status=201, data=lambda number: {
+                         'email': f'new{number}@example.com',
+                         'username': f'new{number}',
+                         'first_name': 'New', 'last_name': 'User',
+                         'password': SEED_PASSWORD,
+                     }),
+            Scenario('users.me', self.client, 'get', '/api/users/me/'),
+            Scenario('users.subscriptions', self.client, 'get',
+                     '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+            Scenario('users.retrieve', self.client, 'get',
+                     f'/api/users/{self.author.pk}/'),
+            Scenario('users.update', self.client, 'put', viewer, data={
+                'email': self.viewer.email,
+                'username': self.viewer.username,
+                'first_name': self.viewer.first_name,
+                'last_name': self.viewer.last_name,
+                'is_subscribed': False,
+            }),
+            Scenario('users.partial_update', self.client, 'patch', viewer,
+                     data={'first_name': self.viewer.first_name}),
+            Scenario('users.destroy', self.admin, 'delete',
+                     '/api/users/{prepared}/', status=204,
+                     prepare=self.create_user,
+                     data={'current_password': SEED_PASSWORD}),
+            Scenario('users.set_password', self.client, 'post',
+                     '/api/users/set_password/', data=password, status=204),
+            Scenario('users.subscribe', self.client, 'post', subscribe,
+                     prepare=self.undo('delete', subscribe)),
+            Scenario('users.unsubscribe', self.client, 'delete', subscribe,
+                     status=204, prepare=self.undo('post', subscribe)),
+        ]
+
+    def get_reference_scenarios(self, basename, pk, data, create):
+        '''Returns scenarios of tags or ingredients model viewset.'''
+        detail = f'/api/{basename}/{{prepared}}/'
+        return [
+            Scenario(f'{basename}.list', self.anonymous, 'get',
+                     f'/api/{basename}/'),
+            Scenario(f'{basename}.retrieve', self.anonymous, 'get',
+                     f'/api/{basename}/{pk}/'),
+            Scenario(f'{basename}.create', self.admin, 'post',
+                     f'/api/{basename}/', data=data, status=201),
+            Scenario(f'{basename}.update', self.admin, 'put', detail,
+                     prepare=create,
+                     data=lambda number: data(number + 100000)),
+            Scenario(f'{basename}.partial_update', self.admin, 'patch',
+                     detail, prepare=lambda number: create(number + 200000),
+                     data=lambda number: data(number + 300000)),
+            Scenario(f'{basename}.destroy', self.admin, 'delete', detail,
+                     status=204,
+                     prepare=lambda number: create(number + 400000)),
+        ]
+
+    def get_recipe_scenarios(self):
+        own_recipe = f'/api/recipes/{self.own_recipe}/'
+        recipe = f'/api/recipes/{self.recipe.pk}/'
+        favorite = f'{recipe}favorite/'
+        cart = f'{recipe}shopping_cart/'
+        feed = '/api/recipes/?limit=6'
+        return [
+            Scenario('recipes.list', self.client, 'get', feed),
+            Scenario('recipes.list.anonymous', self.anonymous, 'get', feed),
+            Scenario('recipes.list.cursor', self.client, 'get',
+                     f'{feed}&pagination=cursor'),
+            Scenario('recipes.list.tags', self.client, 'get',
+                     f'{feed}&tags={self.tag.slug}'),
+            Scenario('recipes.list.tags_all', self.client, 'get',
+                     f'{feed}&tags={self.tag.slug}&tags={self.other_tag.slug}'
+                     '&tags_mode=all'),
+            Scenario('recipes.list.author', self.client, 'get',
+                     f'{feed}&author={self.author.pk}'),
+            Scenario('recipes.list.is_favorited', self.client, 'get',
+                     f'{feed}&is_favorited=1'),
+            Scenario('recipes.list.is_in_shopping_cart', self.client, 'get',
+                     f'{feed}&is_in_shopping_cart=1'),
+            Scenario('recipes.retrieve', self.client, 'get', recipe),
+            Scenario('recipes.retrieve.anonymous', self.anonymous, 'get',
+                     recipe),
+            Scenario('recipes.create', self.client, 'post', '/api/recipes/',
+                     data=self.recipe_data, status=201),
+            Scenario('recipes.update', self.client, 'put', own_recipe,
+                     data=lambda number: self.recipe_data(10000 + number)),
+            Scenario('recipes.partial_update', self.client, 'patch',
+                     own_recipe,
+                     data=lambda number: {'cooking_time': number % 100 + 1}),
+            Scenario('recipes.destroy', self.client, 'delete',
+                     '/api/recipes/{prepared}/', status=204,
+                     prepare=lambda number: self.create_recipe(20000 + number)
+                     ),
+            Scenario('recipes.favorite', self.client, 'post', favorite,
+                     prepare=self.undo('delete', favorite)),
+            Scenario('recipes.remove_favorite', self.client, 'delete',
+                     favorite, status=204,
+                     prepare=self.undo('post', favorite)),
+            Scenario('recipes.shopping_cart', self.client, 'post', cart,
+                     prepare=self.undo('delete', cart)),
+            Scenario('recipes.remove_from_shopping_cart', self.client,
+                     'delete', cart, status=204,
+                     prepare=self.undo('post', cart)),
+            Scenario('recipes.download_shopping_cart', self.client, 'get',
+                     '/api/recipes/download_shopping_cart/'),
+        ]
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import variants_suffix
+from recipes.models import Recipe, build_image_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds resized variants of recipe images "
+        "which do not have them yet or have them built with other settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild variants of every recipe image.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.exclude(image_variants=variants_suffix())
+        built = 0
+        for pk, image_name in recipes.values_list('pk', 'image').iterator():
+            try:
+                build_image_variants(pk, image_name, force=options['all'])
+            except OSError as error:
+                self.stderr.write(f'{image_name}: {error}')
+                continue
+            built += 1
+        self.stdout.write(f'Image variants built for {built} recipes.')
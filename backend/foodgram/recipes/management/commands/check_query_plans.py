@@ -0,0 +1,119 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.utils import explain_json, shoplist_ingredients
+from recipes.models import (FavoriteRecipe, Recipe, RecipeIngredient,
+                            RecipeTag, ShoplistIngredient, ShoplistRecipe,
+                            Tag)
+from users.models import User
+
+PAGE_SIZE = 6
+LARGE_TABLES = {
+    model._meta.db_table for model in (
+        Recipe, RecipeTag, RecipeIngredient, FavoriteRecipe,
+        ShoplistRecipe, ShoplistIngredient
+    )
+}
+
+
+def postgresql_scans(queryset):
+    '''Yields (node type, relation) of every scan node of query plan.'''
+    plans = [explain_json(queryset)[0]['Plan']]
+    while plans:
+        plan = plans.pop()
+        if 'Relation Name' in plan:
+            yield plan['Node Type'], plan['Relation Name']
+        plans.extend(plan.get('Plans', ()))
+
+
+def sqlite_scans(queryset):
+    '''
+    Yields (operation, table) of every table access of query plan.
+    SQLite reports subquery tables by their aliases, they are resolved
+    to table names from the sql.
+    '''
+    aliases = {
+        alias: table for table, alias in
+        re.findall(r'"(\w+)" (U\d+)\b', str(queryset.query))
+    }
+    for line in queryset.explain().splitlines():
+        words = line.split()
+        if 'SCAN' in words or 'SEARCH' in words:
+            operation = 'SCAN' if 'SCAN' in words else 'SEARCH'
+            table = words[words.index(operation) + 1]
+            if table == 'TABLE':
+                table = words[words.index(operation) + 2]
+            if operation == 'SCAN' and 'INDEX' in words:
+                operation = 'SCAN USING INDEX'
+            yield operation, aliases.get(table, table)
+
+
+SCANNERS = {
+    'postgresql': (postgresql_scans, {'Seq Scan'}),
+    'sqlite': (sqlite_scans, {'SCAN'}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks that feed, filter and shopping list queries read large "
+        "tables through indexes. Run on a seeded database."
+    )
+
+    def get_queries(self):
+        user = User.objects.annotate(
+            total=Count('shoplist_recipes')
+        ).order_by('-total').first()
+        author = User.objects.order_by('-recipes_count').first()
+        tags = list(Tag.objects.annotate(
+            total=Count('attached_to')
+        ).order_by('-total').values_list('slug', flat=True)[:2])
+        if user is None or not tags:
+            raise CommandError('Database has no users or tags to check.')
+        request = RequestFactory().get('/')
+        request.user = user
+        feed = Recipe.objects.order_by('-pub_date', '-id')
+
+        def filtered(**params):
+            return RecipeFilter(
+                params, queryset=feed, request=request
+            ).qs[:PAGE_SIZE]
+
+        return {
+            'feed': feed[:PAGE_SIZE],
+            'author': filtered(author=author.pk),
+            'tags': filtered(tags=tags[:1]),
+            'tags_all': filtered(tags=tags, tags_mode='all'),
+            'favorites': filtered(is_favorited='true'),
+            'shopping_cart': filtered(is_in_shopping_cart='true'),
+            'shopping_list': shoplist_ingredients(user),
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SCANNERS:
+            raise CommandError(
+                f'Query plans of {connection.vendor} are not supported.'
+            )
+        scanner, full_scans = SCANNERS[connection.vendor]
+        failed = []
+        for name, queryset in self.get_queries().items():
+            scans = sorted(set(scanner(queryset)))
+            bad_scans = [
+                (operation, table) for operation, table in scans
+                if operation in full_scans and table in LARGE_TABLES
+            ]
+            status = 'FAIL' if bad_scans else 'ok'
+            self.stdout.write(f'{name}: {status} ' + ', '.join(
+                f'{operation} {table}' for operation, table in scans
+            ))
+            if bad_scans:
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                'Full scans of large tables in: ' + ', '.join(failed)
+            )
@@ -0,0 +1,59 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import variant_names, variants_suffix
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes recipe image files and image variants "
+        "which are not referenced by any recipe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep files modified less than this number of seconds ago.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report files which would be deleted.'
+        )
+
+    def handle(self, *args, **options):
+        image_field = Recipe._meta.get_field('image')
+        storage = image_field.storage
+        directory = image_field.upload_to
+        images = Recipe.objects.exclude(image='').values_list(
+            'image', 'image_variants'
+        )
+        references = Counter()
+        keep = set()
+        suffix = variants_suffix()
+        for image_name, built_suffix in images.iterator():
+            references[image_name] += 1
+            keep.add(image_name)
+            keep.update(variant_names(
+                image_name, {suffix, built_suffix} - {''}
+            ))
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        deleted_count = deleted_size = 0
+        for filename in storage.listdir(directory)[1]:
+            name = posixpath.join(directory, filename)
+            if name in keep or storage.get_modified_time(name) > threshold:
+                continue
+            deleted_count += 1
+            deleted_size += storage.size(name)
+            if not options['dry_run']:
+                storage.delete(name)
+        shared_count = sum(1 for count in references.values() if count > 1)
+        self.stdout.write(
+            f'{len(references)} images referenced, {shared_count} shared '
+            f'by several recipes. Deleted {deleted_count} files, '
+            f'{deleted_size} bytes.'
+        )
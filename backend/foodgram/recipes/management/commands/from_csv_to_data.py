@@ -1,20 +1,164 @@
 import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient
+from recipes.versions import bump_version, model_version_name
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, 'recipes', 'data', 'ingredients.csv'
+)
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    '''Yields (name, measurement_unit) pairs from csv file.'''
+    for line_number, row in enumerate(csv.reader(file), start=1):
+        if len(row) != 2:
+            raise CommandError(
+                f'Line {line_number}: expected 2 fields, got {len(row)}.'
+            )
+        yield row
+
+
+def read_json(file, chunk_size=JSON_CHUNK_SIZE):
+    '''
+    Yields (name, measurement_unit) pairs from json list of objects.
+    Objects are decoded one by one from a buffer refilled with chunks
+    of the file, so memory does not grow with file size.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Expected json list of objects.')
+    position = 1
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError(
+                    f'Invalid json near: {buffer[position:][:100]!r}'
+                )
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def chunked(iterable, size):
+    '''Splits iterable into lists of at most size items.'''
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def copy_ingredients(rows):
+    '''
+    Loads rows through PostgreSQL COPY into temporary table
+    and moves them to ingredients table skipping existing pairs.
+    '''
+    table = Ingredient._meta.db_table
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS ingredients_import '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY ingredients_import (name, measurement_unit) '
+            'FROM STDIN WITH CSV', buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT name, measurement_unit FROM ingredients_import '
+            'ON CONFLICT DO NOTHING'
+        )
+        cursor.execute('TRUNCATE ingredients_import')
 
 
 class Command(BaseCommand):
     help = (
-        "Populates foodgram database with ingredients data from csv file."
+        "Populates foodgram database with ingredients data "
+        "from csv or json file."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Path to ingredients .csv or .json file.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows inserted per query.'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Load rows with COPY, PostgreSQL only.'
+        )
+
     def handle(self, *args, **options):
-        with open('recipes/data/ingredients.csv', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name, measurement_unit=measurement_unit
-                )
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Only .csv and .json files are supported.')
+        use_copy = options['copy']
+        if use_copy and connection.vendor != 'postgresql':
+            raise CommandError('COPY loading requires PostgreSQL.')
+        started = time.monotonic()
+        read_count = 0
+        seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+        existing_count = len(seen)
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            for chunk in chunked(reader(file), options['batch_size']):
+                read_count += len(chunk)
+                rows = []
+                for name, measurement_unit in chunk:
+                    key = (name.strip(), measurement_unit.strip())
+                    if key not in seen:
+                        seen.add(key)
+                        rows.append(key)
+                if not rows:
+                    continue
+                if use_copy:
+                    copy_ingredients(rows)
+                else:
+                    Ingredient.objects.bulk_create(
+                        [
+                            Ingredient(name=name, measurement_unit=unit)
+                            for name, unit in rows
+                        ],
+                        ignore_conflicts=True
+                    )
+        created_count = Ingredient.objects.count() - existing_count
+        if created_count:
+            bump_version(model_version_name(Ingredient))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Read {read_count} rows, created {created_count} ingredients '
+            f'in {elapsed:.2f}s ({read_count / elapsed:.0f} rows/s).'
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipe, Recipe
+from users.models import Follow, User
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (Recipe, 'fans_count', FavoriteRecipe, 'recipe'),
+)
+
+
+def actual_count(related_model, related_field):
+    '''
+    Returns subquery that counts related_model rows
+    referencing outer row through related_field.
+    '''
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates denormalized recipes, followers and favorites "
+        "counters of users and recipes."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                count = actual_count(related_model, related_field)
+                updated = model.objects.exclude(
+                    **{field: count}
+                ).update(**{field: count})
+                self.stdout.write(
+                    f'{model.__name__}.{field}: {updated} rows fixed.'
+                )
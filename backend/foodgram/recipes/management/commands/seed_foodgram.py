@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import (FavoriteRecipe, Recipe, RecipeIngredient,
+                            RecipeTag, ShoplistIngredient, ShoplistRecipe)
+from recipes.seeding import seed_dataset
+from users.models import Follow, User
+
+MODELS = (
+    User, Recipe, RecipeIngredient, RecipeTag, Follow,
+    FavoriteRecipe, ShoplistRecipe, ShoplistIngredient,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds deterministic synthetic users, recipes, follows, favorites "
+        "and shopping carts with Zipf distributed popularity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Average number of followed authors per user.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Average number of favorite recipes per user.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Average number of shopping cart recipes per user.'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Exponent of Zipf popularity distribution.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of rows inserted per query.'
+        )
+
+    def progress(self, name, rows, elapsed):
+        if self.verbosity > 0:
+            self.stdout.write(
+                f'{name}: {rows} rows, '
+                f'{rows / max(elapsed, 1e-6):.0f} rows/s'
+            )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        before = {model: model.objects.count() for model in MODELS}
+        seed_dataset(
+            users=options['users'], recipes=options['recipes'],
+            follows=options['follows'], favorites=options['favorites'],
+            cart=options['cart'], random_seed=options['seed'],
+            exponent=options['exponent'], batch_size=options['batch_size'],
+            progress=self.progress
+        )
+        elapsed = time.monotonic() - started
+        total = 0
+        for model in MODELS:
+            added = model.objects.count() - before[model]
+            total += added
+            self.stdout.write(f'{model.__name__}: +{added}')
+        summary = (
+            f'Added {total} rows in {elapsed:.1f}s '
+            f'({total / max(elapsed, 1e-6):.0f} rows/s).'
+        )
+        top_author = User.objects.order_by('-recipes_count').first()
+        if top_author is not None:
+            summary += f' Top author has {top_author.recipes_count} recipes.'
+        top_recipe = Recipe.objects.order_by('-fans_count').first()
+        if top_recipe is not None:
+            summary += f' Top recipe has {top_recipe.fans_count} fans.'
+        self.stdout.write(summary)
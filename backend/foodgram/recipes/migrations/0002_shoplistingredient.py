@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shoplist_totals(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoplistIngredient = apps.get_model('recipes', 'ShoplistIngredient')
+    shoplist_amounts = RecipeIngredient.objects.filter(
+        recipe__shoplist_users__isnull=False
+    ).values(
+        'recipe__shoplist_users__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    ShoplistIngredient.objects.bulk_create(
+        ShoplistIngredient(
+            user_id=row['recipe__shoplist_users__user'],
+            ingredient_id=row['ingredient'],
+            amount=row['total']
+        ) for row in shoplist_amounts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoplistIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Суммарное число единиц')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoplist_totals', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoplist_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Shoplist ingredients',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoplistingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='shoplist - ingredient unique constraint'),
+        ),
+        migrations.RunPython(fill_shoplist_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    User.objects.update(recipes_count=Coalesce(
+        Subquery(
+            Recipe.objects.filter(author=OuterRef('pk')).order_by().values(
+                'author'
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    ))
+    Recipe.objects.update(fans_count=Coalesce(
+        Subquery(
+            FavoriteRecipe.objects.filter(recipe=OuterRef('pk')).order_by(
+            ).values('recipe').annotate(total=Count('pk')).values('total')
+        ),
+        0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_shoplistingredient'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fans_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в Избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
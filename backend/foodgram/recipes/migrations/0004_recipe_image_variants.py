@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_fans_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='Суффикс имён уменьшенных копий изображения'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipeingredient_covering_idx'
+
+
+def create_covering_index(apps, schema_editor):
+    '''
+    Lets shoplist totals and recipe ingredients be read from index only.
+    INCLUDE is available on PostgreSQL 11 and newer,
+    other databases rely on the unique (recipe, ingredient) index.
+    '''
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+        return
+    table = apps.get_model('recipes', 'RecipeIngredient')._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {table} (recipe_id) '
+        'INCLUDE (ingredient_id, amount)'
+    )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_feed_and_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_covering_index, drop_covering_index),
+    ]
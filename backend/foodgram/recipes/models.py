@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from users.managers import MembershipManager
+from .images import VARIANTS, build_variants, image_worker, variant_name
+from .storage import ContentHashStorage
 
 User = get_user_model()
 
@@ -80,6 +85,7 @@ class Recipe(models.Model):
     text = models.TextField(verbose_name="Описание рецепта")
     image = models.ImageField(
         upload_to="recipes/images/",
+        storage=ContentHashStorage(),
         verbose_name="Изображение блюда"
     )
     tags = models.ManyToManyField(
@@ -94,10 +100,73 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)],
         verbose_name="Время приготовления (в минутах)"
     )
+    fans_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name="Число добавлений в Избранное"
+    )
+    image_variants = models.CharField(
+        max_length=16, blank=True, default="", editable=False,
+        verbose_name="Суффикс имён уменьшенных копий изображения"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        image_changed = bool(self.image) and not self.image._committed
+        if image_changed:
+            self.image_variants = ''
+        # Counter receivers run inside the same transaction as the insert.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if image_changed:
+                transaction.on_commit(self.schedule_image_variants)
+
+    def schedule_image_variants(self):
+        '''Queues building of image variants in background worker.'''
+        image_worker.submit(build_image_variants, self.pk, self.image.name)
+
+    def image_urls(self):
+        '''
+        Returns urls of image variants,
+        url of the original is used until variants are built.
+        '''
+        if not self.image_variants:
+            return dict.fromkeys(VARIANTS, self.image.url)
+        return {
+            variant: self.image.storage.url(
+                variant_name(self.image.name, variant, self.image_variants)
+            )
+            for variant in VARIANTS
+        }
+
+
+def build_image_variants(recipe_pk, image_name, force=False):
+    '''
+    Builds variants of recipe image and saves suffix of their names
+    to recipe if its image was not replaced in the meantime.
+    '''
+    suffix = build_variants(image_name, force=force)
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_pk, image=image_name
+        ).first()
+        if recipe is not None and recipe.image_variants != suffix:
+            recipe.image_variants = suffix
+            recipe.save(update_fields=['image_variants'])
+
 
 class RecipeTag(models.Model):
     recipe = models.ForeignKey(
@@ -119,6 +188,12 @@ class RecipeTag(models.Model):
                 name="recipe - tag unique constraint"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipetag_tag_recipe_idx'
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -159,6 +234,8 @@ class FavoriteRecipe(models.Model):
         verbose_name="Любимый рецепт"
     )
 
+    objects = MembershipManager()
+
     class Meta:
         verbose_name = "Favorite recipes"
         constraints = [
@@ -181,6 +258,8 @@ class ShoplistRecipe(models.Model):
         verbose_name="Рецепт в списке покупок"
     )
 
+    objects = MembershipManager()
+
     class Meta:
         verbose_name = "Shoplist recipes"
         constraints = [
@@ -189,3 +268,126 @@ class ShoplistRecipe(models.Model):
                 name="shoplist - recipe unique constraint"
             )
         ]
+
+
+class ShoplistIngredientManager(models.Manager):
+    '''
+    Keeps per-user shoplist ingredient totals in sync
+    with recipes added to or removed from shoplists.
+    '''
+    def apply_deltas(self, user_ids, deltas):
+        '''
+        Adds amount deltas to ingredient totals of given users,
+        totals that drop to zero are removed.
+        '''
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        user_ids = list(user_ids)
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient, amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient, delta in deltas.items() if delta > 0
+                ],
+                ignore_conflicts=True
+            )
+            totals = self.filter(user__in=user_ids, ingredient__in=deltas)
+            totals.update(amount=F('amount') + Case(
+                *[
+                    When(ingredient=ingredient, then=Value(delta))
+                    for ingredient, delta in deltas.items()
+                ],
+                output_field=models.IntegerField()
+            ))
+            totals.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user_id, recipe_id):
+        self.apply_deltas([user_id], recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.apply_deltas([user_id], recipe_amounts(recipe_id, sign=-1))
+
+    def update_recipe(self, recipe, previous_amounts, amounts=None):
+        '''
+        Applies changes of recipe ingredients to shoplists
+        of all users who added the recipe.
+        '''
+        if amounts is None:
+            amounts = recipe_amounts(recipe.pk)
+        self.apply_deltas(
+            recipe.shoplist_users.values_list('user', flat=True),
+            {
+                ingredient: (
+                    amounts.get(ingredient, 0)
+                    - previous_amounts.get(ingredient, 0)
+                )
+                for ingredient in amounts.keys() | previous_amounts.keys()
+            }
+        )
+
+    def rebuild(self, user_ids=None):
+        '''
+        Recalculates shoplist totals from scratch
+        for given users or for all users if none are given.
+        Returns number of created totals.
+        '''
+        shoplist_filter = {'recipe__shoplist_users__isnull': False}
+        totals = self.all()
+        if user_ids is not None:
+            shoplist_filter = {'recipe__shoplist_users__user__in': user_ids}
+            totals = totals.filter(user__in=user_ids)
+        shoplist_amounts = RecipeIngredient.objects.filter(
+            **shoplist_filter
+        ).values(
+            'recipe__shoplist_users__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+        with transaction.atomic():
+            totals.delete()
+            return len(self.bulk_create(
+                self.model(
+                    user_id=row['recipe__shoplist_users__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total']
+                ) for row in shoplist_amounts.iterator()
+            ))
+
+
+def recipe_amounts(recipe_id, sign=1):
+    '''Returns recipe ingredient amounts mapped by ingredient id.'''
+    return {
+        ingredient: sign * amount
+        for ingredient, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient', 'amount')
+    }
+
+
+class ShoplistIngredient(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="shoplist_ingredients",
+        verbose_name="Пользователь"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name="shoplist_totals",
+        verbose_name="Ингредиент"
+    )
+    amount = models.IntegerField(verbose_name="Суммарное число единиц")
+
+    objects = ShoplistIngredientManager()
+
+    class Meta:
+        verbose_name = "Shoplist ingredients"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="shoplist - ingredient unique constraint"
+            )
+        ]
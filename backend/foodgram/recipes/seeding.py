@@ -0,0 +1,209 @@
+import io
+import random
+import time
+from bisect import bisect
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from users.models import Follow, User
+from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoplistIngredient, ShoplistRecipe, Tag)
+from .versions import (RECIPES_VERSION, bump_versions,
+                       membership_version_name, model_version_name)
+
+SEED_PASSWORD = 'seed-password'
+SEED_IMAGE = 'recipes/images/seed.png'
+REBUILD_CHUNK_SIZE = 500
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#B07D62', 'baking'),
+    ('Суп', '#2D9CDB', 'soup'),
+    ('Салат', '#27AE60', 'salad'),
+    ('Напиток', '#56CCF2', 'drink'),
+    ('Закуска', '#EB5757', 'snack'),
+    ('Вегетарианское', '#6FCF97', 'vegetarian'),
+)
+
+
+class Zipf:
+    '''
+    Draws items of population with probability inversely
+    proportional to power of their rank, so that few items
+    are very popular and most of them are rare.
+    '''
+    def __init__(self, population, exponent, generator):
+        self.population = list(population)
+        self.generator = generator
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+
+    def choice(self):
+        position = self.generator.random() * self.cum_weights[-1]
+        return self.population[bisect(self.cum_weights, position)]
+
+    def sample(self, size):
+        '''Returns up to size distinct items.'''
+        size = min(size, len(self.population))
+        items = set()
+        for _ in range(size * 4):
+            if len(items) == size:
+                break
+            items.add(self.choice())
+        return sorted(items)
+
+
+def bulk_insert(model, objects, batch_size, progress=None,
+                ignore_conflicts=False):
+    '''
+    Inserts objects in batches of at most batch_size rows,
+    limited by database maximum of query parameters.
+    Calls progress with model name, number of inserted rows
+    and elapsed seconds after each batch.
+    '''
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    # Backends without parameter limit return number of given objects.
+    batch_size = min(
+        batch_size,
+        connection.ops.bulk_batch_size(fields, range(batch_size))
+    )
+    started = time.monotonic()
+    objects = iter(objects)
+    inserted = 0
+    batch = list(islice(objects, batch_size))
+    while batch:
+        model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+        inserted += len(batch)
+        if progress is not None:
+            progress(model.__name__, inserted, time.monotonic() - started)
+        batch = list(islice(objects, batch_size))
+
+
+def new_pks(model, after):
+    '''Returns ordered primary keys of model rows greater than after.'''
+    return list(model.objects.filter(pk__gt=after).order_by(
+        'pk'
+    ).values_list('pk', flat=True))
+
+
+def last_pk(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+def seed_dataset(users=2000, recipes=5000, follows=10, favorites=20,
+                 cart=5, random_seed=0, exponent=1.1, batch_size=5000,
+                 progress=None):
+    '''
+    Adds generated users, recipes, follows, favorites and shoplists
+    to database. Same arguments on the same database state
+    always produce the same dataset.
+
+    Authors, ingredients, tags, followed authors, favorited
+    and shoplist recipes are drawn from Zipf distribution
+    with given exponent. follows, favorites and cart are average
+    numbers of rows per user. Ingredients are loaded from bundled csv file.
+
+    Rows are bulk inserted without signals, so version stamps of recipes,
+    reference data and memberships of new users are bumped at the end.
+    '''
+    generator = random.Random(random_seed)
+
+    def insert(model, objects, ignore_conflicts=True):
+        bulk_insert(model, objects, batch_size, progress, ignore_conflicts)
+
+    def per_user(average):
+        return generator.randint(0, 2 * average)
+
+    def popular(ids):
+        return Zipf(generator.sample(ids, len(ids)), exponent, generator)
+
+    call_command('from_csv_to_data', stdout=io.StringIO())
+    with transaction.atomic():
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+    ingredients = popular(new_pks(Ingredient, 0))
+    tags = popular(new_pks(Tag, 0))
+
+    first_user = last_pk(User)
+    password = make_password(SEED_PASSWORD)
+    insert(User, (
+        User(
+            username=f'seed{number}', email=f'seed{number}@example.com',
+            first_name='Seed', last_name=f'User {number}', password=password
+        )
+        for number in range(first_user + 1, first_user + users + 1)
+    ), ignore_conflicts=False)
+    user_ids = new_pks(User, first_user)
+    authors = popular(user_ids)
+
+    first_recipe = last_pk(Recipe)
+    insert(Recipe, (
+        Recipe(
+            author_id=authors.choice(), name=f'Рецепт {number}',
+            text='Описание рецепта.', image=SEED_IMAGE,
+            cooking_time=generator.randint(5, 120)
+        )
+        for number in range(first_recipe + 1, first_recipe + recipes + 1)
+    ), ignore_conflicts=False)
+    recipe_ids = new_pks(Recipe, first_recipe)
+    popular_recipes = popular(recipe_ids)
+
+    insert(RecipeIngredient, (
+        RecipeIngredient(
+            recipe_id=recipe_id, ingredient_id=ingredient_id,
+            amount=generator.randint(1, 500)
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in ingredients.sample(generator.randint(3, 12))
+    ))
+    insert(RecipeTag, (
+        RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in tags.sample(generator.randint(1, 3))
+    ))
+    insert(Follow, (
+        Follow(follower_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in authors.sample(per_user(follows))
+        if author_id != user_id
+    ))
+    for model, average in (
+        (FavoriteRecipe, favorites), (ShoplistRecipe, cart)
+    ):
+        insert(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in popular_recipes.sample(per_user(average))
+        ))
+
+    call_command('refresh_counters', stdout=io.StringIO())
+    started = time.monotonic()
+    rebuilt = 0
+    for start in range(0, len(user_ids), REBUILD_CHUNK_SIZE):
+        rebuilt += ShoplistIngredient.objects.rebuild(
+            user_ids[start:start + REBUILD_CHUNK_SIZE]
+        )
+        if progress is not None:
+            progress(
+                ShoplistIngredient.__name__, rebuilt,
+                time.monotonic() - started
+            )
+    bump_versions([
+        RECIPES_VERSION, model_version_name(Tag),
+        model_version_name(Ingredient),
+        *(membership_version_name(user_id) for user_id in user_ids),
+    ])
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.managers import change_counter, lock_deleted_row
+from .models import (FavoriteRecipe, Recipe, ShoplistIngredient,
+                     ShoplistRecipe)
+
+User = get_user_model()
+
+
+# Counters are kept by receivers, so cascades and queryset deletes
+# update them too. bulk_create sends no signals, refresh_counters
+# recalculates counters after bulk inserts. Membership rows are
+# locked before their counters are decremented, so a row deleted
+# by two transactions at once is counted once.
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def count_created_favorite(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'fans_count', 1)
+
+
+@receiver(pre_delete, sender=FavoriteRecipe)
+def count_deleted_favorite(instance, **kwargs):
+    if lock_deleted_row(instance):
+        change_counter(Recipe, instance.recipe_id, 'fans_count', -1)
+
+
+@receiver(post_save, sender=ShoplistRecipe)
+def add_to_shoplist_totals(instance, created, **kwargs):
+    if created:
+        ShoplistIngredient.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+# pre_delete is sent before any row of a cascade is deleted,
+# so ingredients of a recipe deleted along with shoplist rows
+# are still there to be subtracted. Totals are changed only
+# while the shoplist row is locked and known to be deleted
+# by this transaction.
+@receiver(pre_delete, sender=ShoplistRecipe)
+def subtract_from_shoplist_totals(instance, **kwargs):
+    if lock_deleted_row(instance):
+        ShoplistIngredient.objects.remove_recipe(
+            instance.user_id, instance.recipe_id
+        )
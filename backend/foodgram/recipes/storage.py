@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    '''Returns SHA-256 hex digest of file content read in chunks.'''
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    '''
+    File system storage which names files by SHA-256 of their content.
+    Saving content that is already stored returns the existing name
+    without writing the file again, so one blob is shared by every
+    row referencing the same image. Modification time of reused blob
+    is refreshed to keep it from garbage collection grace period.
+    '''
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, content_hash(content) + extension)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,53 @@
+import time
+
+from django.core.cache import caches
+
+RECIPES_VERSION = 'recipes.recipe'
+
+
+def get_version(name):
+    '''
+    Returns shared version stamp of named data set,
+    stamp is initialised on first use.
+    '''
+    key = f'version:{name}'
+    version = caches['versions'].get(key)
+    if version is None:
+        caches['versions'].add(key, f'{time.time():.6f}', timeout=None)
+        version = caches['versions'].get(key)
+    return version
+
+
+def get_versions(names):
+    '''Returns version stamps of several data sets with one cache read.'''
+    keys = {name: f'version:{name}' for name in names}
+    versions = caches['versions'].get_many(keys.values())
+    return [
+        versions[key] if key in versions else get_version(name)
+        for name, key in keys.items()
+    ]
+
+
+def bump_version(name):
+    '''Marks named data set as changed for all worker processes.'''
+    caches['versions'].set(
+        f'version:{name}', f'{time.time():.6f}', timeout=None
+    )
+
+
+def bump_versions(names):
+    '''Marks several data sets as changed with one cache write.'''
+    version = f'{time.time():.6f}'
+    caches['versions'].set_many(
+        {f'version:{name}': version for name in names}, timeout=None
+    )
+
+
+def model_version_name(model):
+    '''Names version of all rows of model.'''
+    return model._meta.label_lower
+
+
+def membership_version_name(user_id):
+    '''Names version of favorites, shoplist and follows of the user.'''
+    return f'membership:{user_id}'
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from recipes.models import FavoriteRecipe, ShoplistRecipe
+from recipes.models import FavoriteRecipe, ShoplistIngredient, ShoplistRecipe
 from .models import Follow, User
 
 
@@ -43,5 +43,9 @@ class AdminUser(UserAdmin):
         ShoplistInline
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoplistIngredient.objects.rebuild([form.instance.pk])
+
 
 admin.site.register(User, AdminUser)
@@ -0,0 +1,56 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+class MembershipManager(models.Manager):
+    '''
+    Adds and removes rows linking user to another object
+    with a single write whose result tells whether the row existed.
+    '''
+    def add(self, **fields):
+        '''Inserts the row, returns False if it already exists.'''
+        try:
+            with transaction.atomic():
+                self.create(**fields)
+        except IntegrityError:
+            return False
+        return True
+
+    def remove(self, **fields):
+        '''
+        Deletes the row, returns False if there was none.
+        Row is locked first, so of concurrent removes only one
+        finds it and delete receivers run once.
+        '''
+        with transaction.atomic():
+            instance = self.select_for_update().filter(**fields).first()
+            if instance is None:
+                return False
+            instance.delete_locked = True
+            instance.delete()
+        return True
+
+
+def lock_deleted_row(instance):
+    '''
+    Locks row of instance which is about to be deleted and returns
+    whether it still exists. Deleting collector reads rows before
+    the lock, so a row deleted by a concurrent transaction
+    meanwhile is reported and its side effects are skipped.
+    '''
+    if not hasattr(instance, 'delete_locked'):
+        instance.delete_locked = type(instance)._base_manager.filter(
+            pk=instance.pk
+        ).select_for_update().exists()
+    return instance.delete_locked
+
+
+def change_counter(model, pk, field, delta):
+    '''
+    Adds delta to denormalized counter of model row,
+    a drifted counter never drops below zero.
+    '''
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
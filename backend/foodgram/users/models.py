@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
 
+from .managers import MembershipManager
 from .validators import username_validator
 
 
@@ -38,6 +39,14 @@ class User(AbstractUser):
         max_length=150,
         verbose_name="Фамилия"
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name="Число рецептов"
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name="Число подписчиков"
+    )
 
     def __str__(self):
         return self.username
@@ -57,6 +66,8 @@ class Follow(models.Model):
         verbose_name="Авторы"
     )
 
+    objects = MembershipManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
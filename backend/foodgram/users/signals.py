@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from .managers import change_counter, lock_deleted_row
+from .models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(pre_delete, sender=Follow)
+def count_deleted_follow(instance, **kwargs):
+    if lock_deleted_row(instance):
+        change_counter(User, instance.author_id, 'followers_count', -1)